@@ -1,11 +1,57 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import streamlit as st
 import pandas as pd
 import sqlite3
+import db_setup
 from store_manager import StoreManager
-import plotly.express as px
+from catalog import ProductCatalog
+from till import Till
+import consolidated
+import dashboard
+import emi
+
+# Seconds between refreshes of the reporting snapshot. 0 (the default) reports
+# off the live file, so a sale shows on the Dashboard straight away. Opting in
+# keeps heavy reports off the live file at the cost of numbers up to this old
+# (payments still refresh it at once), and switches the database to WAL.
+REPORT_REFRESH_SECONDS = float(os.environ.get("REPORT_REFRESH_SECONDS", "0"))
+
+
+@st.cache_resource
+def get_shop(store_id):
+    """One StoreManager per store and server process, so its reporting snapshot survives reruns."""
+    return StoreManager.for_store(store_id, report_refresh_interval=REPORT_REFRESH_SECONDS or None)
+
+
+# Directory for till outboxes. When set, walk-in cash sales on Sell Items are
+# queued locally and synced in the background, so checkout keeps working
+# while the store database is busy or away (see till.py).
+TILL_OUTBOX_DIR = os.environ.get("TILL_OUTBOX_DIR", "")
+
+
+@st.cache_resource
+def get_till(store_id):
+    """This server's till for a store: its own outbox plus a background sync thread."""
+    os.makedirs(TILL_OUTBOX_DIR, exist_ok=True)
+    till = Till(os.path.join(TILL_OUTBOX_DIR, f"{store_id}.db"), get_shop(store_id))
+    till.refresh_products()
+    till.start()
+    return till
+
+
+@st.cache_resource
+def get_catalog(db_name):
+    """One product catalog per store, shared by every session of this server process."""
+    return ProductCatalog(db_name)
+
+
+@st.cache_resource
+def get_report_pool():
+    """Worker processes for the consolidated report, started once per server process."""
+    return ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
 
-# Initialize the Shop
-shop = StoreManager()
 
 # ---------- PAGE CONFIG ----------
 st.set_page_config(
@@ -149,15 +195,45 @@ h1, h2, h3 {
     unsafe_allow_html=True,
 )
 
+def show_report_staleness():
+    """Tell the user how old the numbers on a reporting page are."""
+    staleness = shop.report_staleness()
+    if staleness is None:
+        return
+    col_age, col_refresh = st.columns([4, 1])
+    with col_age:
+        st.caption(f"📸 Report snapshot taken {staleness:.0f}s ago (refreshes every {REPORT_REFRESH_SECONDS:.0f}s).")
+    with col_refresh:
+        if st.button("Refresh data 🔄"):
+            shop.refresh_report_snapshot()
+            st.rerun()
+
+
 # ---------- SIDEBAR ----------
 st.sidebar.title("🛒 Smart Inventory")
 st.sidebar.caption("Manage sales, stock, and insights in one place.")
 
+store_id = st.sidebar.selectbox("Store", db_setup.list_stores())
+
+with st.sidebar.expander("Open a new store"):
+    new_store_id = st.text_input("Store ID", placeholder="e.g. downtown")
+    if st.button("Create store"):
+        try:
+            db_setup.create_store(new_store_id.strip())
+            st.rerun()
+        except ValueError as e:
+            st.error(str(e))
+
 menu_choice = st.sidebar.radio(
     "Go to",
-    ["Dashboard", "Sell Items", "Restock Inventory", "Payments"],
+    ["Dashboard", "Sell Items", "Restock Inventory", "Payments", "All Stores"],
 )
 
+# Initialize the Shop for the selected store
+shop = get_shop(store_id)
+till = get_till(store_id) if TILL_OUTBOX_DIR else None
+catalog = get_catalog(shop.db_name)
+
 # ---------- 1. DASHBOARD ----------
 if menu_choice == "Dashboard":
     st.markdown(
@@ -173,114 +249,59 @@ if menu_choice == "Dashboard":
         unsafe_allow_html=True,
     )
 
-    conn = sqlite3.connect("smart_inventory.db")
     try:
-        df = pd.read_sql_query("SELECT * FROM sales", conn)
+        dash = dashboard.get_dashboard(shop)
     except Exception as e:
         st.error(f"Error reading sales data: {e}")
-        df = pd.DataFrame()
-    finally:
-        conn.close()
+        dash = None
+    show_report_staleness()
 
-    if not df.empty and "total_amount" in df.columns and "quantity" in df.columns:
-        total_revenue = df["total_amount"].sum()
-        total_items_sold = df["quantity"].sum()
-        num_orders = len(df)
-        avg_ticket = total_revenue / num_orders if num_orders > 0 else 0
+    if dash and dash["kpis"]["orders"] > 0:
+        kpis = dash["kpis"]
 
         kpi_col1, kpi_col2, kpi_col3, kpi_col4 = st.columns(4)
         with kpi_col1:
             st.markdown('<div class="kpi-box">', unsafe_allow_html=True)
-            st.metric("Total Revenue", f"${total_revenue:,.2f}")
+            st.metric("Total Revenue", f"${kpis['total_revenue']:,.2f}")
             st.markdown("</div>", unsafe_allow_html=True)
         with kpi_col2:
             st.markdown('<div class="kpi-box">', unsafe_allow_html=True)
-            st.metric("Items Sold", int(total_items_sold))
+            st.metric("Items Sold", kpis["items_sold"])
             st.markdown("</div>", unsafe_allow_html=True)
         with kpi_col3:
             st.markdown('<div class="kpi-box">', unsafe_allow_html=True)
-            st.metric("Orders", num_orders)
+            st.metric("Orders", kpis["orders"])
             st.markdown("</div>", unsafe_allow_html=True)
         with kpi_col4:
             st.markdown('<div class="kpi-box">', unsafe_allow_html=True)
-            st.metric("Avg Ticket", f"${avg_ticket:,.2f}")
+            st.metric("Avg Ticket", f"${kpis['avg_ticket']:,.2f}")
             st.markdown("</div>", unsafe_allow_html=True)
 
         st.markdown('<div class="shop-divider"></div>', unsafe_allow_html=True)
 
         # Optional simple filter
-        products = ["All"] + sorted(df["product_name"].unique().tolist())
+        products = ["All"] + dash["products"]
         selected_product = st.selectbox("Filter by product", products)
 
         if selected_product != "All":
-            df_plot = df[df["product_name"] == selected_product]
-        else:
-            df_plot = df
+            dash = dashboard.get_dashboard(shop, selected_product)
 
         col_chart, col_side = st.columns([2, 1])
 
         with col_chart:
             st.subheader("Revenue by Product")
-            fig = px.bar(
-                df_plot,
-                x="product_name",
-                y="total_amount",
-                color="product_name",
-                title="Sales Performance",
-                labels={"product_name": "Product", "total_amount": "Revenue"},
-            )
-            fig.update_layout(
-                xaxis_title="Product",
-                yaxis_title="Revenue",
-                plot_bgcolor="rgba(15,23,42,0.7)",
-                paper_bgcolor="rgba(15,23,42,0)",
-                font_color="#e5e7eb",
-            )
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(dash["revenue_fig"], use_container_width=True)
 
         with col_side:
-            # Payment method breakdown (if column exists)
-            if "payment_type" in df.columns:
-                st.subheader("Payment Methods")
-                method_counts = df["payment_type"].value_counts().reset_index()
-                method_counts.columns = ["payment_type", "count"]
-                pie = px.pie(
-                    method_counts,
-                    names="payment_type",
-                    values="count",
-                    hole=0.45,
-                    title="Payment Types Used",
-                )
-                pie.update_layout(
-                    plot_bgcolor="rgba(15,23,42,0.7)",
-                    paper_bgcolor="rgba(15,23,42,0)",
-                    font_color="#e5e7eb",
-                )
-                st.plotly_chart(pie, use_container_width=True)
-
-            # Payment status breakdown (if column exists)
-            if "status" in df.columns:
-                st.subheader("Payment Status")
-                status_counts = df["status"].value_counts().reset_index()
-                status_counts.columns = ["status", "count"]
-                bar = px.bar(
-                    status_counts,
-                    x="status",
-                    y="count",
-                    color="status",
-                    text="count",
-                    title="Paid / Pending / Bad Debt",
-                )
-                bar.update_traces(textposition="outside")
-                bar.update_layout(
-                    plot_bgcolor="rgba(15,23,42,0.7)",
-                    paper_bgcolor="rgba(15,23,42,0)",
-                    font_color="#e5e7eb",
-                )
-                st.plotly_chart(bar, use_container_width=True)
-
-        with st.expander("View Transaction Log", expanded=False):
-            st.dataframe(df, use_container_width=True)
+            st.subheader("Payment Methods")
+            st.plotly_chart(dash["payment_fig"], use_container_width=True)
+
+            st.subheader("Payment Status")
+            st.plotly_chart(dash["status_fig"], use_container_width=True)
+
+        with st.expander("View Transaction Log (latest 1,000)", expanded=False):
+            with shop.reporting_connection() as conn:
+                st.dataframe(dashboard.load_recent_sales(conn), use_container_width=True)
     else:
         st.info("No sales data yet. Go to the 'Sell Items' tab to record your first sale.")
 
@@ -309,43 +330,74 @@ elif menu_choice == "Sell Items":
 
     with col2:
         st.markdown("#### Select Product to Sell")
-        conn = sqlite3.connect("smart_inventory.db")
         try:
-            products_df = pd.read_sql_query("SELECT name FROM products", conn)
+            catalog.refresh()
         except Exception as e:
             st.error(f"Error loading products: {e}")
-            products_df = pd.DataFrame(columns=["name"])
-        finally:
-            conn.close()
 
-        product_list = products_df["name"].tolist()
+        if len(catalog):
+            search = st.text_input("Search product", placeholder="Start typing a product name...")
+            product_list = catalog.search(search, limit=50)
+        else:
+            product_list = []
 
         if product_list:
             selected_product = st.selectbox("Choose Product", product_list)
+            product = catalog.get(selected_product)
+            if product:
+                st.caption(f"Price: ${product['price']:,.2f} · In stock: {product['stock']}")
             quantity = st.number_input("Quantity", min_value=1, value=1)
 
             st.markdown("#### Payment Method")
             pay_choice = st.radio(
                 "",
-                ["Cash", "EMI (30 days)", "Credit (15 days)"],
+                ["Cash", "EMI (monthly)", "Credit (15 days)"],
                 horizontal=True,
             )
             pay_map = {
                 "Cash": "Cash",
-                "EMI (30 days)": "EMI",
+                "EMI (monthly)": "EMI",
                 "Credit (15 days)": "Credit",
             }
             payment_type = pay_map[pay_choice]
+            emi_months = emi.DEFAULT_MONTHS
+            if payment_type == "EMI":
+                emi_months = st.number_input("Installments (months)", min_value=1, max_value=36, value=emi.DEFAULT_MONTHS)
+
+            customer_query = st.text_input("Customer (name or phone)", placeholder="Leave empty for a walk-in customer")
+            customer_labels = {"Walk-in customer": None}
+            customer_labels.update(
+                {
+                    f"{c['name']} (#{c['customer_id']}) · owes ${c['outstanding_balance']:,.2f}": c["customer_id"]
+                    for c in shop.find_customers(customer_query)
+                }
+            )
+            customer_id = customer_labels[
+                st.selectbox("Customer", list(customer_labels), index=1 if len(customer_labels) > 1 else 0)
+            ]
+
+            if till is not None:
+                queued = till.status().get("queued", 0)
+                st.caption(f"🧾 Till mode: walk-in cash sales queue locally · {queued} waiting to sync.")
+                if till.last_sync_error:
+                    st.warning(f"Store database unavailable, will retry: {till.last_sync_error}")
 
             if st.button("Confirm Sale ✅"):
-                try:
-                    # Prefer 3-argument version if StoreManager supports it
-                    shop.process_sale(selected_product, int(quantity), payment_type)
-                except TypeError:
-                    # Fallback to old 2-argument version if payment not yet supported
-                    shop.process_sale(selected_product, int(quantity))
-                st.success(f"Successfully sold {quantity} × {selected_product} via {payment_type}!")
-                st.balloons()
+                if payment_type != "Cash" and customer_id is None:
+                    st.error("EMI and Credit sales need a customer. Add one on the Payments page.")
+                elif till is not None and payment_type == "Cash" and customer_id is None:
+                    # Sales on a customer's account still go straight to the ledger
+                    if till.process_sale(selected_product, int(quantity), payment_type):
+                        st.success(f"Sold {quantity} × {selected_product} for cash (queued at the till).")
+                    else:
+                        st.error("Sale refused: not enough stock at this till.")
+                elif shop.process_sale(selected_product, int(quantity), payment_type, customer_id, int(emi_months)):
+                    st.success(f"Successfully sold {quantity} × {selected_product} via {payment_type}!")
+                    st.balloons()
+                else:
+                    st.error("Sale refused: check stock and the customer's credit limit.")
+        elif len(catalog):
+            st.warning(f"No products match '{search}'.")
         else:
             st.warning("No products in stock. Go to 'Restock Inventory' to add items first.")
 
@@ -380,7 +432,7 @@ elif menu_choice == "Restock Inventory":
                 st.error("Please enter a product name before submitting.")
 
     st.markdown("### Current Inventory")
-    conn = sqlite3.connect("smart_inventory.db")
+    conn = sqlite3.connect(shop.db_name)
     try:
         inv_df = pd.read_sql_query("SELECT * FROM products", conn)
     except Exception as e:
@@ -409,18 +461,20 @@ elif menu_choice == "Payments":
         unsafe_allow_html=True,
     )
 
-    conn = sqlite3.connect("smart_inventory.db")
     try:
-        pending_df = pd.read_sql_query(
-            "SELECT sale_id, product_name, total_amount, payment_type, status, due_date, sale_date "
-            "FROM sales WHERE status = 'Pending'",
-            conn,
-        )
+        with shop.reporting_connection() as conn:
+            pending_df = pd.read_sql_query(
+                "SELECT s.sale_id, c.name AS customer, s.product_name, s.total_amount, s.late_fees, "
+                "s.payment_type, s.status, s.due_date, s.sale_date "
+                "FROM sales s LEFT JOIN customers c ON c.customer_id = s.customer_id "
+                "WHERE s.status IN ('Pending', 'Overdue') "
+                "ORDER BY s.status = 'Overdue' DESC, s.due_date",
+                conn,
+            )
     except Exception as e:
         st.error(f"Could not load pending payments. Error: {e}")
         pending_df = pd.DataFrame()
-    finally:
-        conn.close()
+    show_report_staleness()
 
     if pending_df.empty:
         st.info("No pending payments right now. All good.")
@@ -437,10 +491,16 @@ elif menu_choice == "Payments":
         st.write(
             f"- Product: **{selected_row['product_name']}**  \n"
             f"- Total Bill: **${selected_row['total_amount']:.2f}**  \n"
+            f"- Late Fees: **${selected_row['late_fees']:.2f}**  \n"
             f"- Payment Type: **{selected_row['payment_type']}**  \n"
             f"- Due Date: **{selected_row['due_date'] or 'N/A'}**"
         )
 
+        schedule = shop.installment_schedule(int(selected_sale_id))
+        if schedule:
+            st.caption("Installments (payments go to the oldest unpaid one first)")
+            st.dataframe(pd.DataFrame(schedule), use_container_width=True)
+
         amount = st.number_input(
             "Amount received now ($)",
             min_value=0.0,
@@ -455,11 +515,134 @@ elif menu_choice == "Payments":
                 try:
                     shop.record_payment(int(selected_sale_id), float(amount))
                     st.success(f"Recorded payment of ${amount:.2f} for sale #{selected_sale_id}.")
+                    # The pending list comes from the snapshot; show this payment straight away
+                    if shop.report_staleness() is not None:
+                        shop.refresh_report_snapshot()
                 except AttributeError:
                     st.error("record_payment() is not defined in StoreManager. Please add it there.")
                 except Exception as e:
                     st.error(f"Something went wrong while recording payment: {e}")
 
+    # ---------- CUSTOMER LEDGER ----------
+    st.markdown('<div class="shop-divider"></div>', unsafe_allow_html=True)
+    st.subheader("Customer Ledger")
+
+    with st.expander("Add a customer"):
+        with st.form("add_customer_form"):
+            cust_name = st.text_input("Name")
+            cust_phone = st.text_input("Phone (optional)")
+            cust_limit = st.number_input("Credit limit ($, 0 = no limit)", min_value=0.0, step=100.0, format="%.2f")
+            if st.form_submit_button("Add Customer ➕"):
+                if shop.add_customer(cust_name, cust_phone, cust_limit or None):
+                    st.success(f"Added {cust_name}.")
+                else:
+                    st.error("Could not add customer: name is required and phone must be unique.")
+
+    ledger_query = st.text_input("Find a customer (name or phone)")
+    customers = shop.find_customers(ledger_query)
+    if not ledger_query.strip():
+        st.info("Search for a customer to see their ledger.")
+    elif not customers:
+        st.info(f"No customers match '{ledger_query}'.")
+    else:
+        by_label = {f"{c['name']} (#{c['customer_id']})": c for c in customers}
+        customer = by_label[st.selectbox("Customer", list(by_label))]
+
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("Outstanding", f"${customer['outstanding_balance']:,.2f}")
+        with col2:
+            limit = customer["credit_limit"]
+            st.metric("Credit Limit", f"${limit:,.2f}" if limit is not None else "No limit")
+
+        # Statement pages are keyed on the last entry shown; keep the keys
+        # of the pages visited so "Previous" can step back.
+        page_key = f"statement_pages_{store_id}_{customer['customer_id']}"
+        pages = st.session_state.setdefault(page_key, [None])
+        statement = shop.customer_statement(customer["customer_id"], page_size=25, after=pages[-1])
+
+        if statement["entries"]:
+            st.dataframe(
+                pd.DataFrame(statement["entries"]).drop(columns=["rank", "entry_id"]),
+                use_container_width=True,
+            )
+        else:
+            st.info("No transactions for this customer yet.")
+
+        prev_col, page_col, next_col = st.columns([1, 2, 1])
+        with prev_col:
+            if len(pages) > 1 and st.button("⬅ Newer"):
+                pages.pop()
+                st.rerun()
+        with page_col:
+            st.caption(f"Page {len(pages)}")
+        with next_col:
+            if statement["next_cursor"] and st.button("Older ➡"):
+                pages.append(statement["next_cursor"])
+                st.rerun()
+
+# ---------- 5. ALL STORES (CONSOLIDATED) ----------
+elif menu_choice == "All Stores":
+    st.markdown(
+        """
+<div class="shop-card">
+    <h1 style="margin-bottom: 0.2rem;">🏬 All Stores</h1>
+    <p style="color: #9ca3af; margin-top: 0.2rem;">
+        Consolidated KPIs, pending dues and stock levels across every branch.
+    </p>
+    <div class="shop-divider"></div>
+</div>
+""",
+        unsafe_allow_html=True,
+    )
+
+    try:
+        report = consolidated.build_report(executor=get_report_pool())
+    except Exception as e:
+        st.error(f"Could not build the consolidated report: {e}")
+        report = None
+
+    if report is not None and not report["errors"].empty:
+        st.warning("Some store databases could not be read and are left out of the totals.")
+        st.dataframe(report["errors"], use_container_width=True)
+
+    if report and not report["kpis"].empty:
+        totals = report["kpis"].iloc[-1]
+        dues = report["pending"].iloc[-1]
+
+        kpi_col1, kpi_col2, kpi_col3, kpi_col4 = st.columns(4)
+        with kpi_col1:
+            st.markdown('<div class="kpi-box">', unsafe_allow_html=True)
+            st.metric("Total Revenue", f"${totals['revenue']:,.2f}")
+            st.markdown("</div>", unsafe_allow_html=True)
+        with kpi_col2:
+            st.markdown('<div class="kpi-box">', unsafe_allow_html=True)
+            st.metric("Orders", int(totals["orders"]))
+            st.markdown("</div>", unsafe_allow_html=True)
+        with kpi_col3:
+            st.markdown('<div class="kpi-box">', unsafe_allow_html=True)
+            st.metric("Outstanding Dues", f"${dues['outstanding']:,.2f}")
+            st.markdown("</div>", unsafe_allow_html=True)
+        with kpi_col4:
+            st.markdown('<div class="kpi-box">', unsafe_allow_html=True)
+            st.metric("Stores", len(report["kpis"]) - 1)
+            st.markdown("</div>", unsafe_allow_html=True)
+
+        st.markdown('<div class="shop-divider"></div>', unsafe_allow_html=True)
+
+        st.subheader("Sales by Store")
+        st.dataframe(report["kpis"], use_container_width=True)
+
+        st.subheader("Pending Dues by Store")
+        st.dataframe(report["pending"], use_container_width=True)
+
+        st.subheader("Stock Levels")
+        st.dataframe(consolidated.stock_by_store(report["stock"]), use_container_width=True)
+
+        st.caption(f"Consolidated in {report['elapsed_s']:.2f}s.")
+    else:
+        st.info("No store databases found yet.")
+
 
 # ---------- FOOTER ----------
 st.markdown(
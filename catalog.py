@@ -0,0 +1,400 @@
+# catalog.py
+import bisect
+import difflib
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+from collections import Counter
+
+# Most names difflib is asked to compare when a query has no word matches
+TYPO_CANDIDATES = 100
+# Postings tallied to pick them; the rarest trigrams of the query go first
+TYPO_POSTINGS = 10_000
+
+
+class ProductCatalog:
+    """
+    Compact in-memory product index for the POS.
+
+    Product ids, prices and stock live in typed arrays (8 bytes per value),
+    names are interned, and a case-folded sorted key list gives O(log n)
+    exact and prefix lookups. A trigram index over the keys narrows word and
+    typo searches to a handful of candidates. The catalog is refreshed
+    incrementally from the change counter maintained by the triggers in
+    db_setup.py.
+    """
+
+    def __init__(self, db_name="smart_inventory.db"):
+        self.db_name = db_name
+        # catalog_meta.change_seq last applied; None until the first full load
+        self.change_seq = None
+        self._lock = threading.Lock()
+
+        # Slot-indexed columns, ordered by product_id
+        self._ids = array("q")
+        self._prices = array("d")
+        self._stock = array("q")
+        self._names = []
+
+        # Sorted search index: case-folded names and the slot they point to
+        self._keys = []
+        self._key_slots = array("q")
+
+        # Trigram -> ascending positions in _keys of the keys containing it
+        self._trigrams = {}
+
+        self.refresh()
+
+    # ---------- INTERNAL UTILS ----------
+
+    def _get_connection(self):
+        return sqlite3.connect(self.db_name)
+
+    @staticmethod
+    def _key(name: str) -> str:
+        return sys.intern(name.casefold())
+
+    def _slot_for_id(self, product_id: int) -> int | None:
+        slot = bisect.bisect_left(self._ids, product_id)
+        if slot < len(self._ids) and self._ids[slot] == product_id:
+            return slot
+        return None
+
+    def _slot_for_name(self, name: str) -> int | None:
+        name = name.strip()
+        key = self._key(name)
+        pos = bisect.bisect_left(self._keys, key)
+        fallback = None
+        while pos < len(self._keys) and self._keys[pos] == key:
+            slot = self._key_slots[pos]
+            if self._names[slot] == name:
+                return slot
+            # Remember the first case-insensitive match
+            if fallback is None:
+                fallback = slot
+            pos += 1
+        return fallback
+
+    @staticmethod
+    def _trigrams_of(text: str) -> set[str]:
+        # The leading space makes the start of the first word a trigram too
+        text = " " + text
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def _rebuild_index(self) -> None:
+        order = sorted(range(len(self._names)), key=lambda s: self._key(self._names[s]))
+        self._keys = [self._key(self._names[s]) for s in order]
+        self._key_slots = array("q", order)
+
+        trigrams = {}
+        for pos, key in enumerate(self._keys):
+            for gram in self._trigrams_of(key):
+                postings = trigrams.get(gram)
+                if postings is None:
+                    trigrams[gram] = postings = array("i")
+                postings.append(pos)
+        self._trigrams = trigrams
+
+    def _word_postings(self, words: list[str]) -> list:
+        """Posting lists a key must appear in to contain every word."""
+        postings = [self._trigrams.get(w[i:i + 3], ()) for w in words for i in range(len(w) - 2)]
+        if not postings:
+            # Only short words: two-letter ones are matched at the start of a word
+            postings = [self._trigrams.get(" " + w, ()) for w in words if len(w) == 2]
+        return postings
+
+    def _load_all(self, cursor) -> None:
+        cursor.execute("SELECT product_id, name, price, stock FROM products ORDER BY product_id")
+        ids, prices, stock, names = array("q"), array("d"), array("q"), []
+        for product_id, name, price, qty in cursor:
+            ids.append(product_id)
+            names.append(sys.intern(name))
+            prices.append(price)
+            stock.append(qty)
+        self._ids, self._prices, self._stock, self._names = ids, prices, stock, names
+        self._rebuild_index()
+
+    def _apply_changes(self, rows) -> None:
+        needs_reindex = False
+        for product_id, name, price, qty in rows:
+            slot = self._slot_for_id(product_id)
+
+            if name is None:
+                # Product was deleted
+                if slot is not None:
+                    del self._ids[slot], self._prices[slot], self._stock[slot], self._names[slot]
+                    needs_reindex = True
+                continue
+
+            name = sys.intern(name)
+            if slot is None:
+                slot = bisect.bisect_left(self._ids, product_id)
+                self._ids.insert(slot, product_id)
+                self._prices.insert(slot, price)
+                self._stock.insert(slot, qty)
+                self._names.insert(slot, name)
+                needs_reindex = True
+                continue
+
+            self._prices[slot] = price
+            self._stock[slot] = qty
+            if self._names[slot] != name:
+                self._names[slot] = name
+                needs_reindex = True
+
+        if needs_reindex:
+            self._rebuild_index()
+
+    # ---------- REFRESH ----------
+
+    def refresh(self) -> int:
+        """
+        Bring the catalog up to date with the database.
+        Only products changed since the last refresh are re-read.
+        Returns the number of changed products applied.
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT change_seq FROM catalog_meta WHERE id = 1")
+            row = cursor.fetchone()
+            latest_seq = row[0] if row else 0
+
+            with self._lock:
+                if self.change_seq is None:
+                    self._load_all(cursor)
+                    self.change_seq = latest_seq
+                    return len(self._ids)
+
+                if latest_seq == self.change_seq:
+                    return 0
+
+                cursor.execute(
+                    """
+                    SELECT c.product_id, p.name, p.price, p.stock
+                    FROM product_changes c
+                    LEFT JOIN products p ON p.product_id = c.product_id
+                    WHERE c.change_seq > ? AND c.change_seq <= ?
+                    """,
+                    (self.change_seq, latest_seq),
+                )
+                rows = cursor.fetchall()
+                self._apply_changes(rows)
+                self.change_seq = latest_seq
+                return len(rows)
+
+    # ---------- LOOKUPS ----------
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def names(self) -> list[str]:
+        """All product names in alphabetical (case-insensitive) order."""
+        with self._lock:
+            return [self._names[s] for s in self._key_slots]
+
+    def get(self, name: str) -> dict | None:
+        """
+        Look up a product by name.
+        Returns a dict with product_id, name, price and stock, or None.
+        """
+        with self._lock:
+            slot = self._slot_for_name(name)
+            if slot is None:
+                return None
+            return {
+                "product_id": self._ids[slot],
+                "name": self._names[slot],
+                "price": self._prices[slot],
+                "stock": self._stock[slot],
+            }
+
+    def prefix_search(self, prefix: str, limit: int = 20) -> list[str]:
+        """Product names starting with prefix (case-insensitive)."""
+        key = prefix.strip().casefold()
+        with self._lock:
+            pos = bisect.bisect_left(self._keys, key)
+            results = []
+            while pos < len(self._keys) and len(results) < limit:
+                if not self._keys[pos].startswith(key):
+                    break
+                results.append(self._names[self._key_slots[pos]])
+                pos += 1
+            return results
+
+    def fuzzy_search(self, query: str, limit: int = 20) -> list[str]:
+        """
+        Product names loosely matching query.
+        Names containing every word of the query come first (earliest match
+        wins); only if nothing matches that way are close spellings found by
+        difflib. Both paths start from the trigram index: words are checked
+        only against keys on the shortest posting list of their trigrams, and
+        difflib only sees the TYPO_CANDIDATES keys sharing most trigrams with
+        the query. A query with no word longer than two letters matches them
+        at the start of a word, and one made only of single letters finds
+        nothing here.
+        """
+        words = query.strip().casefold().split()
+        if not words:
+            return []
+
+        with self._lock:
+            postings = self._word_postings(words)
+            if not postings:
+                return []
+
+            hits = []
+            for pos in min(postings, key=len):
+                key = self._keys[pos]
+                first = key.find(words[0])
+                if first < 0:
+                    continue
+                if all(word in key for word in words[1:]):
+                    hits.append((first, pos))
+            hits.sort()
+            results = [self._names[self._key_slots[pos]] for _, pos in hits[:limit]]
+
+            if not results:
+                query_key = " ".join(words)
+                by_key = {self._keys[pos]: pos for pos in self._typo_candidates(query_key)}
+                for key in difflib.get_close_matches(query_key, by_key, n=limit, cutoff=0.6):
+                    results.append(self._names[self._key_slots[by_key[key]]])
+            return results
+
+    def _typo_candidates(self, query_key: str) -> list[int]:
+        """
+        Positions of the keys sharing most trigrams with query_key.
+        Rare trigrams are counted first and common ones are skipped once
+        TYPO_POSTINGS postings have been tallied, so a typo never walks the
+        whole catalog.
+        """
+        postings = sorted((self._trigrams.get(g, ()) for g in self._trigrams_of(query_key)), key=len)
+        counts = Counter()
+        tallied = 0
+        for plist in postings:
+            if counts and tallied + len(plist) > TYPO_POSTINGS:
+                break
+            counts.update(plist)
+            tallied += len(plist)
+        return [pos for pos, _ in counts.most_common(TYPO_CANDIDATES)]
+
+    def search(self, query: str, limit: int = 20) -> list[str]:
+        """Type-ahead search: prefix matches first, topped up with fuzzy matches."""
+        if not query.strip():
+            with self._lock:
+                return [self._names[s] for s in self._key_slots[:limit]]
+
+        results = self.prefix_search(query, limit)
+        if len(results) < limit:
+            seen = set(results)
+            for name in self.fuzzy_search(query, limit):
+                if name not in seen:
+                    results.append(name)
+                    seen.add(name)
+                if len(results) >= limit:
+                    break
+        return results
+
+    # ---------- STATS ----------
+
+    def memory_stats(self) -> dict:
+        """Approximate memory footprint of the catalog, total and per SKU."""
+        with self._lock:
+            total = (
+                sys.getsizeof(self._ids)
+                + sys.getsizeof(self._prices)
+                + sys.getsizeof(self._stock)
+                + sys.getsizeof(self._names)
+                + sys.getsizeof(self._keys)
+                + sys.getsizeof(self._key_slots)
+                + sys.getsizeof(self._trigrams)
+                + sum(sys.getsizeof(g) + sys.getsizeof(p) for g, p in self._trigrams.items())
+            )
+            counted = set()
+            for text in self._names + self._keys:
+                if id(text) not in counted:
+                    counted.add(id(text))
+                    total += sys.getsizeof(text)
+            skus = len(self._ids)
+            return {
+                "skus": skus,
+                "bytes_total": total,
+                "bytes_per_sku": total / skus if skus else 0.0,
+            }
+
+
+def benchmark(num_skus: int = 50_000, lookups: int = 2_000) -> dict:
+    """
+    Build a catalog of num_skus synthetic products in a temporary database
+    and report memory per SKU and lookup latency (microseconds).
+    """
+    import os
+    import random
+    import tempfile
+
+    import db_setup
+
+    tmp_dir = tempfile.mkdtemp(prefix="catalog_bench_")
+    db_name = os.path.join(tmp_dir, "catalog_bench.db")
+    db_setup.create_tables(db_name)
+
+    rng = random.Random(42)
+    words = ["rice", "sugar", "milk", "soap", "tea", "coffee", "salt", "oil", "flour", "biscuit"]
+    with sqlite3.connect(db_name) as conn:
+        conn.executemany(
+            "INSERT INTO products (name, price, stock) VALUES (?, ?, ?)",
+            (
+                (f"{rng.choice(words).title()} {rng.choice(words)} {i:06d}", rng.uniform(1, 500), rng.randint(0, 200))
+                for i in range(num_skus)
+            ),
+        )
+        conn.commit()
+
+    start = time.perf_counter()
+    catalog = ProductCatalog(db_name)
+    load_s = time.perf_counter() - start
+
+    names = catalog.names()
+    samples = [rng.choice(names) for _ in range(lookups)]
+
+    def per_call_us(fn, args):
+        t0 = time.perf_counter()
+        for arg in args:
+            fn(arg)
+        return (time.perf_counter() - t0) / len(args) * 1e6
+
+    # One restock to exercise the incremental path
+    with sqlite3.connect(db_name) as conn:
+        conn.execute("UPDATE products SET stock = stock + 5 WHERE name = ?", (samples[0],))
+        conn.commit()
+    t0 = time.perf_counter()
+    changed = catalog.refresh()
+    refresh_us = (time.perf_counter() - t0) * 1e6
+
+    report = {
+        **catalog.memory_stats(),
+        "full_load_ms": load_s * 1e3,
+        "incremental_refresh_us": refresh_us,
+        "incremental_rows": changed,
+        "get_us": per_call_us(catalog.get, samples),
+        "prefix_search_us": per_call_us(catalog.prefix_search, [s[:4] for s in samples]),
+        "fuzzy_search_us": per_call_us(catalog.fuzzy_search, [s.split()[1] + " " + s[-3:] for s in samples[:200]]),
+        "typo_search_us": per_call_us(catalog.fuzzy_search, [s[:-1] + "x" for s in samples[:20]]),
+    }
+
+    # What the till actually calls: search() with the POS page size
+    pos_search = lambda q: catalog.search(q, limit=50)
+    report["pos_prefix_search_us"] = per_call_us(pos_search, [s[:4] for s in samples[:200]])
+    report["pos_word_search_us"] = per_call_us(pos_search, [s.split()[1] + " " + s[-4:] for s in samples[:200]])
+    report["pos_typo_search_us"] = per_call_us(pos_search, [s[:-1] + "x" for s in samples[:200]])
+
+    os.remove(db_name)
+    os.rmdir(tmp_dir)
+    return report
+
+
+if __name__ == "__main__":
+    skus = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    for metric, value in benchmark(skus).items():
+        print(f"{metric:>24}: {value:,.2f}" if isinstance(value, float) else f"{metric:>24}: {value:,}")
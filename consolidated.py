@@ -0,0 +1,252 @@
+# consolidated.py
+"""
+Consolidated reporting across store shards.
+
+Each store keeps its own database file (see db_setup.store_db_path). The
+shards are split into one chunk per worker process; each worker opens its
+shards read-only, runs the per-store aggregates and returns a few small rows,
+and the parent merges them. Wall time therefore follows the number of cores
+rather than the number of stores. A shard that cannot be read is reported
+on its own row in 'errors' instead of failing the whole report.
+"""
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import db_setup
+
+# Statuses that still have money owed on them
+OPEN_STATUSES = ("Pending", "Overdue")
+
+KPI_QUERY = """
+    SELECT COUNT(*), COALESCE(SUM(quantity), 0), COALESCE(SUM(total_amount), 0)
+    FROM sales
+"""
+
+# {late_fees}: the column, or 0 for shards not yet migrated to EMI schedules
+PENDING_QUERY = f"""
+    SELECT COUNT(*),
+           COALESCE(SUM(s.total_amount), 0),
+           COALESCE(SUM(s.total_amount + {{late_fees}} - COALESCE(p.paid, 0)), 0),
+           MIN(s.due_date)
+    FROM sales s
+    LEFT JOIN (SELECT sale_id, SUM(amount_paid) AS paid FROM payments GROUP BY sale_id) p
+        ON p.sale_id = s.sale_id
+    WHERE s.status IN ({", ".join("?" for _ in OPEN_STATUSES)})
+"""
+
+STOCK_QUERY = "SELECT name, price, stock FROM products"
+
+
+# ---------- WORKER SIDE ----------
+
+def _summarize_shard(store_id: str, path: str) -> dict:
+    """Everything the consolidated report needs from one store, or the error it raised."""
+    try:
+        return _read_shard(store_id, path)
+    except sqlite3.Error as e:
+        return {"store_id": store_id, "error": str(e)}
+
+
+def _read_shard(store_id: str, path: str) -> dict:
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        orders, items, revenue = conn.execute(KPI_QUERY).fetchone()
+        sales_columns = {row[1] for row in conn.execute("PRAGMA table_info(sales)")}
+        late_fees = "s.late_fees" if "late_fees" in sales_columns else "0"
+        pending_count, pending_total, outstanding, oldest_due = conn.execute(
+            PENDING_QUERY.format(late_fees=late_fees), OPEN_STATUSES
+        ).fetchone()
+        stock = conn.execute(STOCK_QUERY).fetchall()
+    finally:
+        conn.close()
+    return {
+        "store_id": store_id,
+        "kpis": (orders, items, revenue),
+        "pending": (pending_count, pending_total, outstanding, oldest_due),
+        "stock": stock,
+    }
+
+
+def _summarize_chunk(shards: list[tuple[str, str]]) -> list[dict]:
+    return [_summarize_shard(store_id, path) for store_id, path in shards]
+
+
+# ---------- PARENT SIDE ----------
+
+def _chunks(items: list, count: int) -> list[list]:
+    count = max(1, min(count, len(items)))
+    return [items[i::count] for i in range(count)]
+
+
+def store_paths(store_ids: list[str] | None = None) -> dict[str, str]:
+    """{store_id: db path} for the given stores, or every store on disk."""
+    return {store_id: db_setup.store_db_path(store_id) for store_id in (store_ids or db_setup.list_stores())}
+
+
+def build_report(
+    shards: dict[str, str] | None = None,
+    max_workers: int | None = None,
+    executor: ProcessPoolExecutor | None = None,
+) -> dict:
+    """
+    Aggregate KPIs, pending dues and stock levels across shards.
+    shards: {store_id: db path}; defaults to every store on disk.
+    max_workers: worker processes (default: CPU count). 1 runs inline.
+    executor: a long-lived pool to run the shards on instead of starting one
+    per call; max_workers then only sets how many chunks it is given.
+    Returns DataFrames 'kpis', 'pending', 'stock' (each with per-store rows;
+    'kpis' and 'pending' end with an 'ALL' total row), 'errors' (store_id,
+    error for each shard that could not be read) and 'elapsed_s'.
+    """
+    start = time.perf_counter()
+    shards = shards if shards is not None else store_paths()
+    items = [(store_id, path) for store_id, path in shards.items() if os.path.exists(path)]
+    max_workers = max_workers or os.cpu_count() or 1
+
+    if max_workers == 1 or len(items) <= 1:
+        summaries = _summarize_chunk(items)
+    elif executor is not None:
+        summaries = [
+            summary
+            for chunk in executor.map(_summarize_chunk, _chunks(items, max_workers))
+            for summary in chunk
+        ]
+    else:
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+            summaries = [
+                summary
+                for chunk in pool.map(_summarize_chunk, _chunks(items, max_workers))
+                for summary in chunk
+            ]
+    summaries.sort(key=lambda summary: summary["store_id"])
+
+    errors = pd.DataFrame(
+        [(s["store_id"], s["error"]) for s in summaries if "error" in s],
+        columns=["store_id", "error"],
+    )
+    summaries = [s for s in summaries if "error" not in s]
+
+    kpis = pd.DataFrame(
+        [(s["store_id"], *s["kpis"]) for s in summaries],
+        columns=["store_id", "orders", "items_sold", "revenue"],
+    )
+    kpis["avg_ticket"] = (kpis["revenue"] / kpis["orders"]).where(kpis["orders"] > 0, 0.0)
+
+    pending = pd.DataFrame(
+        [(s["store_id"], *s["pending"]) for s in summaries],
+        columns=["store_id", "pending_sales", "pending_billed", "outstanding", "oldest_due"],
+    )
+
+    stock = pd.DataFrame(
+        [(s["store_id"], *row) for s in summaries for row in s["stock"]],
+        columns=["store_id", "product", "price", "stock"],
+    )
+
+    if not kpis.empty:
+        totals = {column: kpis[column].sum() for column in ("orders", "items_sold", "revenue")}
+        kpis = pd.concat(
+            [kpis, pd.DataFrame([{
+                "store_id": "ALL",
+                **totals,
+                "avg_ticket": totals["revenue"] / totals["orders"] if totals["orders"] else 0.0,
+            }])],
+            ignore_index=True,
+        )
+        totals = {column: pending[column].sum() for column in ("pending_sales", "pending_billed", "outstanding")}
+        pending = pd.concat(
+            [pending, pd.DataFrame([{
+                "store_id": "ALL",
+                **totals,
+                "oldest_due": pending["oldest_due"].dropna().min() if pending["oldest_due"].notna().any() else None,
+            }])],
+            ignore_index=True,
+        )
+
+    return {
+        "kpis": kpis,
+        "pending": pending,
+        "stock": stock,
+        "errors": errors,
+        "elapsed_s": time.perf_counter() - start,
+    }
+
+
+def stock_by_store(stock: pd.DataFrame) -> pd.DataFrame:
+    """Pivot stock levels to one row per product, one column per store plus a total."""
+    if stock.empty:
+        return stock
+    table = stock.pivot_table(index="product", columns="store_id", values="stock", aggfunc="sum", fill_value=0)
+    table["total"] = table.sum(axis=1)
+    return table.sort_values("total", ascending=False)
+
+
+# ---------- BENCHMARK ----------
+
+def benchmark(num_stores: int = 32, sales_per_store: int = 100_000) -> dict:
+    """
+    Build num_stores synthetic shards in a temp directory and time the
+    consolidated report at 1, 2, 4, ... up to CPU count workers.
+    """
+    import shutil
+    import tempfile
+
+    tmp_dir = tempfile.mkdtemp(prefix="consolidated_bench_")
+    shards = {}
+    for n in range(num_stores):
+        path = os.path.join(tmp_dir, f"store{n:03d}.db")
+        shards[f"store{n:03d}"] = path
+        db_setup.create_tables(path)
+        with sqlite3.connect(path) as conn:
+            conn.executemany(
+                "INSERT INTO products (name, price, stock) VALUES (?, ?, ?)",
+                ((f"Product {i}", 10.0 + i, 100 + n) for i in range(200)),
+            )
+            conn.execute(
+                """
+                WITH RECURSIVE k(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM k WHERE i < ?)
+                INSERT INTO sales (product_name, quantity, total_amount, payment_type, status, due_date, sale_date)
+                SELECT 'Product ' || (i % 200), 1, 10.0 + (i % 200),
+                       CASE WHEN i % 4 = 0 THEN 'Credit' ELSE 'Cash' END,
+                       CASE WHEN i % 4 = 0 THEN 'Pending' ELSE 'Paid' END,
+                       CASE WHEN i % 4 = 0 THEN '2025-02-01' END, '2025-01-01 10:00:00'
+                FROM k
+                """,
+                (sales_per_store,),
+            )
+            conn.commit()
+
+    timings = {}
+    workers = 1
+    cpu_count = os.cpu_count() or 1
+    while True:
+        timings[workers] = build_report(shards, max_workers=workers)["elapsed_s"]
+        if workers >= cpu_count:
+            break
+        workers = min(workers * 2, cpu_count)
+
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    return timings
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        stores = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+        sales = int(sys.argv[3]) if len(sys.argv) > 3 else 100_000
+        print(f"Consolidated report over {stores} stores x {sales:,} sales")
+        for workers, seconds in benchmark(stores, sales).items():
+            print(f"  {workers:>3} workers: {seconds:.2f}s")
+    else:
+        report = build_report()
+        print(report["kpis"].to_string(index=False))
+        print()
+        print(report["pending"].to_string(index=False))
+        if not report["errors"].empty:
+            print()
+            print(report["errors"].to_string(index=False))
+        print(f"\nBuilt in {report['elapsed_s']:.2f}s")
@@ -0,0 +1,305 @@
+# dashboard.py
+"""
+Pre-aggregated, memoized dashboard figures.
+
+The dashboard used to pull every sales row into pandas and hand it to Plotly,
+so the revenue chart carried one bar segment per sale. Here the database does
+the grouping (one row per product / payment type / status) and the figures
+are cached on a cheap data version, so an unchanged database costs one tiny
+query per rerun.
+"""
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+import plotly.express as px
+
+# Products shown individually in the revenue chart; the rest become "Other"
+TOP_PRODUCTS = 25
+
+CHART_LAYOUT = dict(
+    plot_bgcolor="rgba(15,23,42,0.7)",
+    paper_bgcolor="rgba(15,23,42,0)",
+    font_color="#e5e7eb",
+)
+
+_CACHE_SIZE = 16
+_cache = OrderedDict()
+# Every Streamlit session thread shares the cache
+_cache_lock = threading.Lock()
+
+
+# ---------- INTERNAL UTILS ----------
+
+def _memo(key, build):
+    """
+    Tiny LRU: return the cached value for key, building it on a miss.
+    The build runs outside the lock, so two sessions missing at once may
+    both build; the last one in wins.
+    """
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    value = build()
+    with _cache_lock:
+        _cache[key] = value
+        if len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return value
+
+
+# ---------- DATA ----------
+
+def data_version(conn) -> tuple:
+    """
+    Changes whenever sales data can have changed: every StoreManager
+    mutation appends to the events journal, and new sales bump MAX(sale_id).
+    """
+    return conn.execute(
+        "SELECT (SELECT COALESCE(MAX(event_id), 0) FROM events), "
+        "(SELECT COALESCE(MAX(sale_id), 0) FROM sales)"
+    ).fetchone()
+
+
+def load_aggregates(conn) -> dict:
+    """
+    Group sales in SQL with a single scan, then fold the (product, payment
+    type, status) groups into one row per product, payment type and status.
+    """
+    groups = pd.read_sql_query(
+        """
+        SELECT product_name, payment_type, status,
+               COUNT(*)          AS orders,
+               SUM(quantity)     AS items,
+               SUM(total_amount) AS revenue
+        FROM sales
+        GROUP BY product_name, payment_type, status
+        """,
+        conn,
+    )
+    by_product = (
+        groups.groupby("product_name", as_index=False)[["orders", "items", "revenue"]]
+        .sum()
+        .sort_values("revenue", ascending=False, ignore_index=True)
+    )
+    by_payment_type = (
+        groups.groupby("payment_type", as_index=False)["orders"]
+        .sum()
+        .rename(columns={"orders": "count"})
+        .sort_values("count", ascending=False, ignore_index=True)
+    )
+    by_status = (
+        groups.groupby("status", as_index=False)["orders"]
+        .sum()
+        .rename(columns={"orders": "count"})
+        .sort_values("count", ascending=False, ignore_index=True)
+    )
+    return {"by_product": by_product, "by_payment_type": by_payment_type, "by_status": by_status}
+
+
+def load_recent_sales(conn, limit: int = 1000) -> pd.DataFrame:
+    """Newest sales for the transaction log, instead of the whole table."""
+    return pd.read_sql_query(
+        "SELECT * FROM sales ORDER BY sale_id DESC LIMIT ?",
+        conn,
+        params=(limit,),
+    )
+
+
+def kpis(aggregates: dict) -> dict:
+    by_product = aggregates["by_product"]
+    revenue = float(by_product["revenue"].sum())
+    orders = int(by_product["orders"].sum())
+    return {
+        "total_revenue": revenue,
+        "items_sold": int(by_product["items"].sum()),
+        "orders": orders,
+        "avg_ticket": revenue / orders if orders else 0.0,
+    }
+
+
+# ---------- FIGURES ----------
+
+def revenue_figure(by_product: pd.DataFrame, selected_product: str = "All"):
+    if selected_product != "All":
+        plot_df = by_product[by_product["product_name"] == selected_product]
+    elif len(by_product) > TOP_PRODUCTS:
+        top = by_product.head(TOP_PRODUCTS)
+        rest = by_product.iloc[TOP_PRODUCTS:]
+        other = pd.DataFrame(
+            [{
+                "product_name": f"Other ({len(rest)})",
+                "orders": rest["orders"].sum(),
+                "items": rest["items"].sum(),
+                "revenue": rest["revenue"].sum(),
+            }]
+        )
+        plot_df = pd.concat([top, other], ignore_index=True)
+    else:
+        plot_df = by_product
+
+    fig = px.bar(
+        plot_df,
+        x="product_name",
+        y="revenue",
+        color="product_name",
+        hover_data=["orders", "items"],
+        title="Sales Performance",
+        labels={"product_name": "Product", "revenue": "Revenue"},
+    )
+    fig.update_layout(xaxis_title="Product", yaxis_title="Revenue", showlegend=False, **CHART_LAYOUT)
+    return fig
+
+
+def payment_type_figure(by_payment_type: pd.DataFrame):
+    fig = px.pie(
+        by_payment_type,
+        names="payment_type",
+        values="count",
+        hole=0.45,
+        title="Payment Types Used",
+    )
+    fig.update_layout(**CHART_LAYOUT)
+    return fig
+
+
+def status_figure(by_status: pd.DataFrame):
+    fig = px.bar(
+        by_status,
+        x="status",
+        y="count",
+        color="status",
+        text="count",
+        title="Paid / Pending / Overdue / Bad Debt",
+    )
+    fig.update_traces(textposition="outside")
+    fig.update_layout(**CHART_LAYOUT)
+    return fig
+
+
+def get_dashboard(shop, selected_product: str = "All") -> dict:
+    """
+    KPIs, product list and the three dashboard figures for shop, read
+    through its reporting connection and memoized on data_version().
+    """
+    with shop.reporting_connection() as conn:
+        version = data_version(conn)
+        aggregates = _memo(
+            (shop.db_name, version, "aggregates"),
+            lambda: load_aggregates(conn),
+        )
+
+    def build():
+        return {
+            "version": version,
+            "kpis": kpis(aggregates),
+            "products": aggregates["by_product"]["product_name"].sort_values().tolist(),
+            "revenue_fig": revenue_figure(aggregates["by_product"], selected_product),
+            "payment_fig": payment_type_figure(aggregates["by_payment_type"]),
+            "status_fig": status_figure(aggregates["by_status"]),
+        }
+
+    return _memo((shop.db_name, version, "figures", selected_product), build)
+
+
+# ---------- CLI REPORT (used by main.py) ----------
+
+def show_sales_chart(db_name: str = "smart_inventory.db") -> None:
+    """Print the KPIs and plot revenue per product with matplotlib."""
+    import matplotlib.pyplot as plt
+
+    conn = sqlite3.connect(db_name)
+    try:
+        aggregates = load_aggregates(conn)
+    finally:
+        conn.close()
+
+    if aggregates["by_product"].empty:
+        print("No sales yet.")
+        return
+
+    summary = kpis(aggregates)
+    print(
+        f"Revenue: ${summary['total_revenue']:,.2f} | Items: {summary['items_sold']} | "
+        f"Orders: {summary['orders']} | Avg ticket: ${summary['avg_ticket']:,.2f}"
+    )
+    top = aggregates["by_product"].head(TOP_PRODUCTS)
+    plt.bar(top["product_name"], top["revenue"])
+    plt.title("Revenue by Product")
+    plt.xticks(rotation=45, ha="right")
+    plt.tight_layout()
+    plt.show()
+
+
+# ---------- BENCHMARK ----------
+
+def benchmark(num_sales: int = 1_000_000, num_products: int = 200, compare_old: bool = False) -> dict:
+    """
+    Seed num_sales rows into a temporary database and measure aggregation,
+    figure build and serialized payload size, cold and memoized. With
+    compare_old, also time the previous full-DataFrame figure.
+    """
+    import os
+    import shutil
+    import tempfile
+
+    import db_setup
+    from store_manager import StoreManager
+
+    tmp_dir = tempfile.mkdtemp(prefix="dashboard_bench_")
+    db_name = os.path.join(tmp_dir, "dashboard_bench.db")
+    db_setup.create_tables(db_name)
+    with sqlite3.connect(db_name) as conn:
+        conn.execute(
+            """
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+            INSERT INTO sales (product_name, quantity, total_amount, payment_type, status, due_date, sale_date)
+            SELECT 'Product ' || (i % ?), 1 + i % 3, 5.0 + (i % 97),
+                   CASE i % 3 WHEN 0 THEN 'Cash' WHEN 1 THEN 'EMI' ELSE 'Credit' END,
+                   CASE WHEN i % 3 = 0 THEN 'Paid' WHEN i % 11 = 0 THEN 'Bad Debt' ELSE 'Pending' END,
+                   NULL, '2025-01-01 10:00:00'
+            FROM n
+            """,
+            (num_sales, num_products),
+        )
+        conn.commit()
+
+    shop = StoreManager(db_name)
+    report = {"sales": num_sales, "products": num_products}
+
+    start = time.perf_counter()
+    dash = get_dashboard(shop)
+    report["cold_build_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    get_dashboard(shop)
+    report["memoized_build_ms"] = (time.perf_counter() - start) * 1e3
+
+    start = time.perf_counter()
+    payloads = [dash[name].to_json() for name in ("revenue_fig", "payment_fig", "status_fig")]
+    report["serialize_ms"] = (time.perf_counter() - start) * 1e3
+    report["payload_bytes"] = sum(len(p) for p in payloads)
+
+    if compare_old:
+        start = time.perf_counter()
+        conn = sqlite3.connect(db_name)
+        df = pd.read_sql_query("SELECT * FROM sales", conn)
+        conn.close()
+        old_fig = px.bar(df, x="product_name", y="total_amount", color="product_name")
+        old_payload = old_fig.to_json()
+        report["old_build_and_serialize_s"] = time.perf_counter() - start
+        report["old_payload_bytes"] = len(old_payload)
+
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    return report
+
+
+if __name__ == "__main__":
+    import sys
+
+    sales = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    for metric, value in benchmark(sales, compare_old="--compare-old" in sys.argv).items():
+        print(f"{metric:>26}: {value:,.3f}" if isinstance(value, float) else f"{metric:>26}: {value:,}")
@@ -1,17 +1,84 @@
 # db_setup.py
+import os
+import re
 import sqlite3
 
+import emi
+import journal
+
 DB_NAME = "smart_inventory.db"
 
+# Every store (branch) has its own database file. The original single-store
+# file keeps serving the default store so existing installs carry on as-is.
+DEFAULT_STORE = "main"
+STORES_DIR = "stores"
+_STORE_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def store_db_path(store_id: str = DEFAULT_STORE) -> str:
+    """Database file for a store."""
+    if store_id == DEFAULT_STORE:
+        return DB_NAME
+    if not _STORE_ID.match(store_id):
+        raise ValueError(f"Invalid store id {store_id!r}: use letters, digits, '-' and '_'.")
+    return os.path.join(STORES_DIR, f"{store_id}.db")
+
+
+def is_store_db(path: str) -> bool:
+    """True if path is a SQLite file that create_tables has set up."""
+    if not os.path.isfile(path) or os.path.getsize(path) == 0:
+        return False
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sales'").fetchone()
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError:
+        return False
+    return row is not None
+
+
+def list_stores() -> list[str]:
+    """The default store plus every initialized store database in STORES_DIR."""
+    stores = [DEFAULT_STORE]
+    if os.path.isdir(STORES_DIR):
+        stores += sorted(
+            name[:-3]
+            for name in os.listdir(STORES_DIR)
+            if name.endswith(".db")
+            and _STORE_ID.match(name[:-3])
+            and name[:-3] != DEFAULT_STORE
+            and is_store_db(os.path.join(STORES_DIR, name))
+        )
+    return stores
+
+
+def create_store(store_id: str) -> str:
+    """Create (or upgrade) the database for a store and return its path."""
+    path = store_db_path(store_id)
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    create_tables(path)
+    return path
 
-def get_connection():
+
+def get_connection(db_name=DB_NAME):
     """Create a connection to the SQLite database."""
-    return sqlite3.connect(DB_NAME)
+    return sqlite3.connect(db_name)
+
 
+def _add_column(cursor, table: str, column: str, declaration: str) -> None:
+    """ALTER TABLE ... ADD COLUMN, skipped if the column already exists."""
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
 
-def create_tables():
+
+def create_tables(db_name=DB_NAME):
     """Create all required tables if they do not exist."""
-    conn = get_connection()
+    emi.check_sqlite_version()
+    conn = get_connection(db_name)
     cursor = conn.cursor()
 
     # Products table
@@ -56,10 +123,177 @@ def create_tables():
         """
     )
 
+    # Client-generated ids for sales and payments recorded offline at a till;
+    # unique so a batch pushed twice is only applied once.
+    _add_column(cursor, "sales", "client_uuid", "TEXT")
+    _add_column(cursor, "payments", "client_uuid", "TEXT")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_sales_client_uuid ON sales (client_uuid)")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_payments_client_uuid ON payments (client_uuid)")
+    # Every payment sums the sale's earlier payments
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_payments_sale ON payments (sale_id)")
+
+    # Customers buying on EMI/Credit. outstanding_balance is kept up to date
+    # by StoreManager in the same transaction as each sale and payment, so a
+    # credit-limit check is one primary-key lookup.
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS customers (
+            customer_id         INTEGER PRIMARY KEY AUTOINCREMENT,
+            name                TEXT    NOT NULL,
+            phone               TEXT    UNIQUE,
+            credit_limit        REAL,              -- NULL: no limit
+            outstanding_balance REAL    NOT NULL DEFAULT 0,
+            created_at          TEXT    NOT NULL
+        );
+        """
+    )
+    # Customer search at the till is a name prefix (LIKE is case-insensitive,
+    # so the index must be too); phone lookups use the UNIQUE index
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_customers_name ON customers (name COLLATE NOCASE)")
+    _add_column(cursor, "sales", "customer_id", "INTEGER REFERENCES customers (customer_id)")
+    # Copied from the sale so a customer's statement reads payments by index
+    _add_column(cursor, "payments", "customer_id", "INTEGER REFERENCES customers (customer_id)")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_sales_customer ON sales (customer_id, sale_date, sale_id) "
+        "WHERE customer_id IS NOT NULL"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_payments_customer ON payments (customer_id, payment_date, payment_id) "
+        "WHERE customer_id IS NOT NULL"
+    )
+
+    # EMI installment schedules (see emi.py). Late fees charged by the daily
+    # batch are added to the installment and rolled up on the sale.
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS installments (
+            sale_id        INTEGER NOT NULL REFERENCES sales (sale_id),
+            installment_no INTEGER NOT NULL,
+            due_date       TEXT    NOT NULL,
+            amount_due     REAL    NOT NULL,
+            amount_paid    REAL    NOT NULL DEFAULT 0,
+            late_fee       REAL    NOT NULL DEFAULT 0,
+            status         TEXT    NOT NULL DEFAULT 'Due',  -- 'Due', 'Overdue', 'Paid'
+            paid_date      TEXT,
+            PRIMARY KEY (sale_id, installment_no)
+        ) WITHOUT ROWID;
+        """
+    )
+    # The daily batch only ever looks at installments not yet due-checked
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_installments_due ON installments (due_date) WHERE status = 'Due'"
+    )
+    _add_column(cursor, "sales", "late_fees", "REAL NOT NULL DEFAULT 0")
+
+    # Catalog change tracking: every insert/update/delete on products bumps a
+    # single counter and stamps the product with it, so the in-memory catalog
+    # can refresh only the rows that changed since it last looked.
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS catalog_meta (
+            id         INTEGER PRIMARY KEY CHECK (id = 1),
+            change_seq INTEGER NOT NULL
+        );
+        """
+    )
+    cursor.execute("INSERT OR IGNORE INTO catalog_meta (id, change_seq) VALUES (1, 0)")
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS product_changes (
+            product_id INTEGER PRIMARY KEY,
+            change_seq INTEGER NOT NULL
+        );
+        """
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_product_changes_seq ON product_changes (change_seq)"
+    )
+    for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+        cursor.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_products_{event.lower()}
+            AFTER {event} ON products
+            BEGIN
+                UPDATE catalog_meta SET change_seq = change_seq + 1 WHERE id = 1;
+                INSERT OR REPLACE INTO product_changes (product_id, change_seq)
+                SELECT {row}.product_id, change_seq FROM catalog_meta WHERE id = 1;
+            END;
+            """
+        )
+
+    # Append-only journal of every StoreManager mutation
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS events (
+            event_id   INTEGER PRIMARY KEY,
+            event_type TEXT    NOT NULL,  -- see the event types in journal.py
+            entity_id  INTEGER NOT NULL,  -- product_id, sale_id or customer_id, depending on type
+            delta      REAL    NOT NULL,
+            created_at TEXT    NOT NULL
+        );
+        """
+    )
+    for action in ("UPDATE", "DELETE"):
+        cursor.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_events_no_{action.lower()}
+            BEFORE {action} ON events
+            BEGIN
+                SELECT RAISE(ABORT, 'events journal is append-only');
+            END;
+            """
+        )
+
+    # Journal snapshots. Each snapshot only stores the products and sales
+    # touched since the previous one; the state at a snapshot is the latest
+    # row per entity up to and including it.
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS journal_snapshots (
+            snapshot_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_id    INTEGER NOT NULL,  -- last event folded into this snapshot
+            created_at  TEXT    NOT NULL
+        );
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS snapshot_stock (
+            product_id  INTEGER NOT NULL,
+            snapshot_id INTEGER NOT NULL,
+            stock       INTEGER NOT NULL,
+            PRIMARY KEY (product_id, snapshot_id)
+        ) WITHOUT ROWID;
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS snapshot_sales (
+            sale_id      INTEGER NOT NULL,
+            snapshot_id  INTEGER NOT NULL,
+            total_amount REAL    NOT NULL,  -- bill plus late fees
+            amount_paid  REAL    NOT NULL,
+            status       TEXT    NOT NULL,
+            PRIMARY KEY (sale_id, snapshot_id)
+        ) WITHOUT ROWID;
+        """
+    )
+
     conn.commit()
+
+    # Databases created before the journal existed get a baseline snapshot
+    # of their current state so replay has somewhere to start from.
+    journal.ensure_baseline(conn)
+
     conn.close()
 
 
 if __name__ == "__main__":
-    create_tables()
-    print("Database and tables created.")
+    import sys
+
+    if len(sys.argv) > 1:
+        for store in sys.argv[1:]:
+            print(f"Store '{store}' ready at {create_store(store)}.")
+    else:
+        create_tables()
+        print("Database and tables created.")
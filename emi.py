@@ -0,0 +1,353 @@
+# emi.py
+"""
+EMI installment schedules.
+
+An EMI sale is split into monthly installments when it is made. Payments
+are allocated to the oldest unpaid installment first. Once a day
+run_daily_batch() flags installments whose due date has passed unpaid,
+charges each a one-off late fee and marks their sales 'Overdue'. The whole
+batch is a handful of set-based statements, so its cost follows the number
+of installments falling due rather than the number of plans.
+
+    python emi.py run [--store main] [--as-of YYYY-MM-DD]
+    python emi.py bench [plans]
+"""
+import calendar
+import sqlite3
+import time
+from datetime import datetime
+
+import journal
+
+# Installments per EMI sale unless the sale asks for another number
+DEFAULT_MONTHS = 3
+
+# One-off late fee on the unpaid part of a missed installment
+LATE_FEE_RATE = 0.02
+
+# Same tolerance StoreManager uses to call an amount settled
+PAID_TOLERANCE = journal.PAID_TOLERANCE
+
+# allocate_payment and the daily batch update with UPDATE ... FROM
+MIN_SQLITE_VERSION = (3, 33, 0)
+
+
+def check_sqlite_version() -> None:
+    """Raise RuntimeError if the linked SQLite library is too old for EMI schedules."""
+    if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+        raise RuntimeError(
+            f"SQLite {sqlite3.sqlite_version} is too old: EMI schedules need "
+            f"{'.'.join(map(str, MIN_SQLITE_VERSION))} or newer."
+        )
+
+
+def _add_months(moment: datetime, months: int) -> str:
+    """Same day `months` later, clamped to the end of shorter months."""
+    month_index = moment.month - 1 + months
+    year, month = moment.year + month_index // 12, month_index % 12 + 1
+    day = min(moment.day, calendar.monthrange(year, month)[1])
+    return f"{year:04d}-{month:02d}-{day:02d}"
+
+
+# ---------- PER-SALE (CALLER'S TRANSACTION) ----------
+
+def create_schedule(cursor, sale_id: int, total_amount: float, sale_date: str, months: int = DEFAULT_MONTHS) -> str:
+    """
+    Write the installments for an EMI sale using the caller's cursor.
+    The total is split evenly to the cent; the last installment takes the
+    rounding difference. Returns the first due date.
+    """
+    months = max(1, int(months))
+    sold_at = datetime.strptime(sale_date, "%Y-%m-%d %H:%M:%S")
+    amount = round(total_amount / months, 2)
+    last_amount = round(total_amount - amount * (months - 1), 2)
+    due_dates = [_add_months(sold_at, n) for n in range(1, months + 1)]
+    cursor.executemany(
+        "INSERT INTO installments (sale_id, installment_no, due_date, amount_due) VALUES (?, ?, ?, ?)",
+        (
+            (sale_id, n, due_date, last_amount if n == months else amount)
+            for n, due_date in enumerate(due_dates, start=1)
+        ),
+    )
+    return due_dates[0]
+
+
+def allocate_payment(cursor, sale_id: int, amount: float, payment_date: str) -> None:
+    """
+    Spread a payment over the sale's unpaid installments, oldest first, and
+    move the sale's due_date to its next unpaid installment. Does nothing
+    for sales without a schedule. Any excess beyond the schedule stays on
+    the sale's payment total only.
+    """
+    cursor.execute(
+        """
+        UPDATE installments
+        SET amount_paid = amount_paid + a.alloc,
+            status = CASE WHEN amount_due + late_fee - amount_paid - a.alloc <= :tolerance
+                          THEN 'Paid' ELSE status END,
+            paid_date = CASE WHEN amount_due + late_fee - amount_paid - a.alloc <= :tolerance
+                             THEN :payment_date ELSE paid_date END
+        FROM (
+            SELECT installment_no, MIN(owed, :amount - (running - owed)) AS alloc
+            FROM (
+                SELECT installment_no,
+                       amount_due + late_fee - amount_paid AS owed,
+                       SUM(amount_due + late_fee - amount_paid) OVER (ORDER BY installment_no) AS running
+                FROM installments
+                WHERE sale_id = :sale_id AND status <> 'Paid'
+            )
+            WHERE running - owed < :amount
+        ) AS a
+        WHERE installments.sale_id = :sale_id AND installments.installment_no = a.installment_no
+        """,
+        {"sale_id": sale_id, "amount": amount, "payment_date": payment_date, "tolerance": PAID_TOLERANCE},
+    )
+    if cursor.rowcount:
+        cursor.execute(
+            """
+            UPDATE sales SET due_date = (
+                SELECT MIN(due_date) FROM installments WHERE sale_id = :sale_id AND status <> 'Paid'
+            )
+            WHERE sale_id = :sale_id
+            """,
+            {"sale_id": sale_id},
+        )
+
+
+def has_overdue(cursor, sale_id: int) -> bool:
+    cursor.execute(
+        "SELECT 1 FROM installments WHERE sale_id = ? AND status = 'Overdue' LIMIT 1",
+        (sale_id,),
+    )
+    return cursor.fetchone() is not None
+
+
+# ---------- DAILY BATCH ----------
+
+def run_daily_batch(db_name: str, as_of: str | None = None, journal_events: bool = True) -> dict:
+    """
+    Flag every installment due before as_of (YYYY-MM-DD, default today)
+    that is still unpaid, charge its late fee, and in bulk mark the sales
+    'Overdue', add the fees to their late_fees and to their customers'
+    outstanding balances, and journal one LATE_FEE event per sale.
+    Safe to rerun: an installment is only flagged once.
+    The database must already exist; it is opened read-write, never created.
+    Returns counts and the elapsed time.
+    """
+    as_of = as_of or datetime.now().strftime("%Y-%m-%d")
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    start = time.perf_counter()
+
+    conn = sqlite3.connect(f"file:{db_name}?mode=rw", uri=True, isolation_level=None)
+    try:
+        cursor = conn.cursor()
+        # A backlog touches many pages; keep them (and the temp tables) in memory
+        cursor.execute("PRAGMA cache_size = -262144")
+        cursor.execute("PRAGMA temp_store = MEMORY")
+        cursor.execute("BEGIN IMMEDIATE")
+
+        # 1. Newly missed installments. Collected unsorted on their own first,
+        #    so the partial index on open installments drives the lookup (an
+        #    ORDER BY here would tempt the planner into walking the primary
+        #    key), then sorted by key so the updates below walk each table in
+        #    order.
+        cursor.execute("DROP TABLE IF EXISTS temp.due")
+        cursor.execute(
+            """
+            CREATE TEMP TABLE due AS
+            SELECT sale_id, installment_no, amount_due - amount_paid AS unpaid
+            FROM installments
+            WHERE status = 'Due' AND due_date < ?
+            """,
+            (as_of,),
+        )
+        cursor.execute("DROP TABLE IF EXISTS temp.missed")
+        cursor.execute(
+            """
+            CREATE TEMP TABLE missed AS
+            SELECT d.sale_id, d.installment_no, s.customer_id, ROUND(d.unpaid * ?, 2) AS fee
+            FROM temp.due d
+            JOIN sales s ON s.sale_id = d.sale_id
+            WHERE s.status IN ('Pending', 'Overdue')
+            ORDER BY d.sale_id, d.installment_no
+            """,
+            (LATE_FEE_RATE,),
+        )
+        cursor.execute(
+            """
+            UPDATE installments
+            SET status = 'Overdue', late_fee = late_fee + m.fee
+            FROM temp.missed AS m
+            WHERE installments.sale_id = m.sale_id AND installments.installment_no = m.installment_no
+            """
+        )
+        installments_flagged = cursor.rowcount
+
+        # 2. Roll the fees up per sale and apply them in bulk
+        cursor.execute("DROP TABLE IF EXISTS temp.sale_fees")
+        cursor.execute(
+            """
+            CREATE TEMP TABLE sale_fees AS
+            SELECT sale_id, customer_id, ROUND(SUM(fee), 2) AS fee
+            FROM temp.missed
+            GROUP BY sale_id
+            """
+        )
+        cursor.execute(
+            """
+            UPDATE sales
+            SET status = 'Overdue', late_fees = late_fees + f.fee
+            FROM temp.sale_fees AS f
+            WHERE sales.sale_id = f.sale_id
+            """
+        )
+        sales_flagged = cursor.rowcount
+
+        cursor.execute(
+            """
+            UPDATE customers
+            SET outstanding_balance = outstanding_balance + c.fee
+            FROM (
+                SELECT customer_id, SUM(fee) AS fee
+                FROM temp.sale_fees
+                WHERE customer_id IS NOT NULL
+                GROUP BY customer_id
+            ) AS c
+            WHERE customers.customer_id = c.customer_id
+            """
+        )
+
+        if journal_events:
+            cursor.execute(
+                "INSERT INTO events (event_type, entity_id, delta, created_at) "
+                "SELECT ?, sale_id, fee, ? FROM temp.sale_fees ORDER BY sale_id",
+                (journal.LATE_FEE, now),
+            )
+
+        cursor.execute("SELECT COALESCE(SUM(fee), 0) FROM temp.sale_fees")
+        late_fees = cursor.fetchone()[0]
+        cursor.execute("DROP TABLE temp.due")
+        cursor.execute("DROP TABLE temp.missed")
+        cursor.execute("DROP TABLE temp.sale_fees")
+        cursor.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    return {
+        "as_of": as_of,
+        "installments_flagged": installments_flagged,
+        "sales_flagged": sales_flagged,
+        "late_fees": late_fees,
+        "elapsed_s": time.perf_counter() - start,
+    }
+
+
+# ---------- BENCHMARK ----------
+
+def benchmark(plans: int = 1_000_000, months: int = 6) -> dict:
+    """
+    Seed `plans` active EMI sales with `months` installments each into a
+    temporary database (two thirds have paid their first installment) and
+    time the daily batch: a catch-up run over a quarter's backlog, an
+    immediate rerun, and then a single ordinary day.
+    """
+    import os
+    import shutil
+    import tempfile
+
+    import db_setup
+
+    tmp_dir = tempfile.mkdtemp(prefix="emi_bench_")
+    db_name = os.path.join(tmp_dir, "emi_bench.db")
+    db_setup.create_tables(db_name)
+    with sqlite3.connect(db_name) as conn:
+        conn.execute(
+            """
+            WITH RECURSIVE k(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM k WHERE i < 1000)
+            INSERT INTO customers (name, credit_limit, created_at)
+            SELECT 'Customer ' || i, NULL, '2025-01-01 00:00:00' FROM k
+            """
+        )
+        # Plan n was sold on day n % 90 of 2025; due dates follow monthly
+        conn.execute(
+            """
+            WITH RECURSIVE k(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM k WHERE i < ?)
+            INSERT INTO sales (product_name, quantity, total_amount, payment_type, status,
+                               due_date, sale_date, customer_id, late_fees)
+            SELECT 'Product ' || (i % 200), 1, 600.0, 'EMI', 'Pending',
+                   date('2025-01-01', '+' || (i % 90) || ' days', '+1 month'),
+                   datetime('2025-01-01', '+' || (i % 90) || ' days'), 1 + i % 1000, 0
+            FROM k
+            """,
+            (plans,),
+        )
+        conn.execute(
+            """
+            WITH RECURSIVE m(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM m WHERE n < ?)
+            INSERT INTO installments (sale_id, installment_no, due_date, amount_due, amount_paid, status)
+            SELECT s.sale_id, m.n, date(s.sale_date, '+' || m.n || ' months'), 600.0 / ?,
+                   CASE WHEN m.n = 1 AND s.sale_id % 3 <> 0 THEN 600.0 / ? ELSE 0 END,
+                   CASE WHEN m.n = 1 AND s.sale_id % 3 <> 0 THEN 'Paid' ELSE 'Due' END
+            FROM sales s CROSS JOIN m
+            ORDER BY s.sale_id, m.n
+            """,
+            (months, months, months),
+        )
+        conn.execute(
+            """
+            UPDATE customers SET outstanding_balance = (
+                SELECT SUM(total_amount) FROM sales WHERE sales.customer_id = customers.customer_id
+            )
+            """
+        )
+        conn.commit()
+
+    # Sales span Jan-Mar 2025; nothing has been checked before April
+    backlog = run_daily_batch(db_name, "2025-04-01")
+    rerun = run_daily_batch(db_name, "2025-04-01")
+    day = run_daily_batch(db_name, "2025-04-02")
+
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    return {
+        "plans": plans,
+        "installments": plans * months,
+        "backlog_flagged": backlog["installments_flagged"],
+        "backlog_s": backlog["elapsed_s"],
+        "rerun_flagged": rerun["installments_flagged"],
+        "rerun_s": rerun["elapsed_s"],
+        "day_flagged": day["installments_flagged"],
+        "day_s": day["elapsed_s"],
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import db_setup
+
+    parser = argparse.ArgumentParser(description="EMI installment batch.")
+    parser.add_argument("command", choices=["run", "bench"])
+    parser.add_argument("plans", nargs="?", type=int, default=1_000_000, help="bench: EMI plans to seed")
+    parser.add_argument("--store", default=db_setup.DEFAULT_STORE)
+    parser.add_argument("--as-of", help="run: flag installments due before this date (default today)")
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        for metric, value in benchmark(args.plans).items():
+            print(f"{metric:>16}: {value:,.3f}" if isinstance(value, float) else f"{metric:>16}: {value:,}")
+    else:
+        path = db_setup.store_db_path(args.store)
+        if not db_setup.is_store_db(path):
+            parser.error(f"store {args.store!r} has no database at {path}")
+        # An existing store may predate EMI schedules
+        db_setup.create_tables(path)
+        result = run_daily_batch(path, args.as_of)
+        print(
+            f"{result['as_of']}: {result['installments_flagged']} installments missed on "
+            f"{result['sales_flagged']} sales, late fees {result['late_fees']:.2f} "
+            f"({result['elapsed_s']:.2f}s)"
+        )
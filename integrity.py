@@ -0,0 +1,535 @@
+# integrity.py
+"""
+Integrity checker for stock, sales, payments, installments and customer
+balances.
+
+Every check is a set-based query that returns only the offending rows, run
+over the sales table a chunk of sale_ids at a time. Memory stays bounded
+by the chunk size and the number of sample rows kept per check, and time
+grows linearly with the rows checked.
+
+Each run records high-water marks (last sale_id, payment_id and event_id
+seen) in integrity_runs. An incremental run checks new sales and payments,
+plus older sales that the events journal or a new payment says have
+changed since. Changes made behind StoreManager's back (raw SQL, journal
+disabled) are only caught by a --full run.
+
+    python integrity.py [--store main] [--full] [--report report.json]
+    python integrity.py bench [sales]
+
+Exit status is 1 when any check fails, so a nightly job can alert on it,
+and 2 when the store cannot be checked at all. The checker never creates
+or migrates the database it audits; it only adds its own integrity_runs
+table.
+"""
+import argparse
+import json
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+import db_setup
+import journal
+
+# Tolerance for money comparisons, as everywhere else
+PAID_TOLERANCE = journal.PAID_TOLERANCE
+
+# Customer balances are a running sum of floats
+BALANCE_TOLERANCE = 0.01
+
+# Tables and columns the checks read, i.e. a store migrated by db_setup
+REQUIRED_SCHEMA = {
+    "products": ("product_id", "stock"),
+    "sales": ("late_fees", "customer_id"),
+    "payments": ("customer_id",),
+    "installments": ("sale_id",),
+    "customers": ("outstanding_balance",),
+    "events": ("event_id",),
+}
+
+# Each run records how far it got so the next one only checks what changed
+RUNS_TABLE = """
+    CREATE TABLE IF NOT EXISTS integrity_runs (
+        run_id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        mode            TEXT    NOT NULL,  -- 'full' or 'incremental'
+        started_at      TEXT    NOT NULL,
+        finished_at     TEXT    NOT NULL,
+        last_sale_id    INTEGER NOT NULL,
+        last_payment_id INTEGER NOT NULL,
+        last_event_id   INTEGER NOT NULL,
+        violations      INTEGER NOT NULL
+    )
+"""
+
+# Journal events that can change a sale's status or amounts
+SALE_EVENTS = (journal.SALE, journal.PAYMENT, journal.BAD_DEBT, journal.LATE_FEE, journal.OVERDUE_CLEARED)
+
+CHECKS = {
+    "paid_underpaid": "Sale marked Paid but payments are less than bill plus late fees",
+    "open_but_settled": "Sale Pending/Overdue but already fully paid",
+    "invalid_status": "Sale status is not Paid, Pending, Overdue or Bad Debt",
+    "unknown_product": "Sale names a product that is not in products",
+    "schedule_mismatch": "EMI installments do not add up to the sale total",
+    "orphan_payments": "Payment references a sale_id that does not exist",
+    "non_positive_payments": "Payment amount is zero or negative",
+    "orphan_installments": "Installment references a sale_id that does not exist",
+    "customer_balance_mismatch": "Customer outstanding_balance differs from their unpaid sales",
+    "negative_stock": "Product stock is below zero",
+}
+
+# The same chunk filter is applied to payments, installments and sales
+SALES_QUERY = """
+    SELECT s.sale_id, s.status, s.product_name,
+           s.total_amount + s.late_fees AS owed,
+           COALESCE(p.paid, 0) AS paid,
+           i.scheduled,
+           s.total_amount,
+           pr.product_id IS NULL AS unknown_product
+    FROM sales s
+    LEFT JOIN (
+        SELECT sale_id, SUM(amount_paid) AS paid FROM payments
+        WHERE {payments_filter} GROUP BY sale_id
+    ) p ON p.sale_id = s.sale_id
+    LEFT JOIN (
+        SELECT sale_id, SUM(amount_due) AS scheduled FROM installments
+        WHERE {installments_filter} GROUP BY sale_id
+    ) i ON i.sale_id = s.sale_id
+    LEFT JOIN products pr ON pr.name = s.product_name
+    WHERE {sales_filter}
+      AND (
+           (s.status = 'Paid' AND COALESCE(p.paid, 0) < s.total_amount + s.late_fees - ?)
+        OR (s.status IN ('Pending', 'Overdue') AND COALESCE(p.paid, 0) >= s.total_amount + s.late_fees - ?)
+        OR s.status IS NULL OR s.status NOT IN ('Paid', 'Pending', 'Overdue', 'Bad Debt')
+        OR pr.product_id IS NULL
+        OR (i.scheduled IS NOT NULL AND ABS(i.scheduled - s.total_amount) > 0.01)
+      )
+"""
+
+PAYMENTS_QUERY = """
+    SELECT p.payment_id, p.sale_id, p.amount_paid, s.sale_id IS NULL AS orphan
+    FROM payments p
+    LEFT JOIN sales s ON s.sale_id = p.sale_id
+    WHERE p.payment_id > ? AND p.payment_id <= ?
+      AND (s.sale_id IS NULL OR p.amount_paid <= 0)
+"""
+
+ORPHAN_INSTALLMENTS_QUERY = """
+    SELECT i.sale_id, i.installment_no
+    FROM installments i
+    LEFT JOIN sales s ON s.sale_id = i.sale_id
+    WHERE {installments_filter} AND s.sale_id IS NULL
+"""
+
+# Unpaid amount per customer, walking each customer's sales by index
+CUSTOMERS_QUERY = """
+    SELECT c.customer_id, c.outstanding_balance,
+           COALESCE((
+               SELECT SUM(MAX(s.total_amount + s.late_fees - COALESCE((
+                   SELECT SUM(amount_paid) FROM payments WHERE sale_id = s.sale_id
+               ), 0), 0))
+               FROM sales s
+               WHERE s.customer_id = c.customer_id
+           ), 0) AS expected
+    FROM customers c
+    WHERE {customers_filter}
+"""
+
+
+class IntegrityChecker:
+    """Set-based consistency checks with a high-water mark for nightly runs."""
+
+    def __init__(self, db_name="smart_inventory.db", chunk_size: int = 200_000, sample_size: int = 20):
+        """
+        Raises FileNotFoundError if db_name is not a store database, and
+        RuntimeError if it predates the schema the checks read.
+        """
+        if not db_setup.is_store_db(db_name):
+            raise FileNotFoundError(f"No store database at {db_name}")
+        self.db_name = db_name
+        self.chunk_size = chunk_size
+        self.sample_size = sample_size
+
+        with self._get_connection() as conn:
+            missing = self._missing_schema(conn)
+            if missing:
+                raise RuntimeError(
+                    f"{db_name} is missing {', '.join(missing)}; open it with the app "
+                    "(or db_setup.create_tables) to migrate it before checking."
+                )
+            conn.execute(RUNS_TABLE)
+
+    # ---------- INTERNAL UTILS ----------
+
+    def _get_connection(self):
+        # mode=rw: an audit must never create the database it is auditing
+        conn = sqlite3.connect(f"file:{self.db_name}?mode=rw", uri=True)
+        conn.execute("PRAGMA temp_store = FILE")
+        return conn
+
+    @staticmethod
+    def _missing_schema(conn) -> list[str]:
+        missing = []
+        for table, columns in REQUIRED_SCHEMA.items():
+            present = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if not present:
+                missing.append(table)
+            else:
+                missing += [f"{table}.{column}" for column in columns if column not in present]
+        return missing
+
+    def _record(self, results: dict, check: str, row: dict) -> None:
+        result = results[check]
+        result["violations"] += 1
+        if len(result["sample"]) < self.sample_size:
+            result["sample"].append(row)
+
+    @staticmethod
+    def _last_run(cursor):
+        cursor.execute(
+            "SELECT last_sale_id, last_payment_id, last_event_id, finished_at FROM integrity_runs "
+            "ORDER BY run_id DESC LIMIT 1"
+        )
+        return cursor.fetchone()
+
+    # ---------- SCOPE ----------
+
+    def _sale_chunks(self, cursor, incremental: bool, low_sale_id: int, high_sale_id: int):
+        """
+        Yield (filter template, params) pairs covering the sales in scope,
+        at most chunk_size sales each. The template has a {col} slot.
+        """
+        if not incremental:
+            for start in range(low_sale_id, high_sale_id, self.chunk_size):
+                yield "{col} > ? AND {col} <= ?", (start, min(start + self.chunk_size, high_sale_id))
+            return
+
+        after = 0
+        while True:
+            cursor.execute(
+                "SELECT MAX(sale_id), COUNT(*) FROM "
+                "(SELECT sale_id FROM temp.scope WHERE sale_id > ? ORDER BY sale_id LIMIT ?)",
+                (after, self.chunk_size),
+            )
+            upper, count = cursor.fetchone()
+            if not count:
+                return
+            yield "{col} IN (SELECT sale_id FROM temp.scope WHERE sale_id > ? AND sale_id <= ?)", (after, upper)
+            after = upper
+
+    def _build_scope(self, cursor, last_sale_id: int, last_payment_id: int, last_event_id: int,
+                     high_sale_id: int, high_payment_id: int, high_event_id: int) -> None:
+        """temp.scope = new sales plus older sales changed since the last run."""
+        cursor.execute("DROP TABLE IF EXISTS temp.scope")
+        cursor.execute("CREATE TEMP TABLE scope (sale_id INTEGER PRIMARY KEY)")
+        cursor.execute(
+            "INSERT INTO temp.scope SELECT sale_id FROM sales WHERE sale_id > ? AND sale_id <= ?",
+            (last_sale_id, high_sale_id),
+        )
+        cursor.execute(
+            f"""
+            INSERT OR IGNORE INTO temp.scope
+            SELECT entity_id FROM events
+            WHERE event_id > ? AND event_id <= ?
+              AND event_type IN ({", ".join("?" for _ in SALE_EVENTS)})
+              AND entity_id <= ?
+            """,
+            (last_event_id, high_event_id, *SALE_EVENTS, high_sale_id),
+        )
+        cursor.execute(
+            "INSERT OR IGNORE INTO temp.scope "
+            "SELECT sale_id FROM payments WHERE payment_id > ? AND payment_id <= ? AND sale_id <= ?",
+            (last_payment_id, high_payment_id, high_sale_id),
+        )
+        cursor.connection.commit()
+
+    # ---------- CHECKS ----------
+
+    def _check_sales(self, cursor, results: dict, sale_filter: str, params: tuple, track_customers: bool) -> None:
+        """Sales-level checks for one chunk of sales."""
+        query = SALES_QUERY.format(
+            payments_filter=sale_filter.format(col="sale_id"),
+            installments_filter=sale_filter.format(col="sale_id"),
+            sales_filter=sale_filter.format(col="s.sale_id"),
+        )
+        cursor.execute(query, (*params, *params, *params, PAID_TOLERANCE, PAID_TOLERANCE))
+        for sale_id, status, product_name, owed, paid, scheduled, total, unknown in cursor.fetchall():
+            row = {"sale_id": sale_id, "status": status}
+            if status == "Paid" and paid < owed - PAID_TOLERANCE:
+                self._record(results, "paid_underpaid", {**row, "owed": owed, "paid": paid})
+            elif status in ("Pending", "Overdue") and paid >= owed - PAID_TOLERANCE:
+                self._record(results, "open_but_settled", {**row, "owed": owed, "paid": paid})
+            elif status not in ("Paid", "Pending", "Overdue", "Bad Debt"):
+                self._record(results, "invalid_status", row)
+            if unknown:
+                self._record(results, "unknown_product", {**row, "product_name": product_name})
+            if scheduled is not None and abs(scheduled - total) > 0.01:
+                self._record(results, "schedule_mismatch", {**row, "total": total, "scheduled": scheduled})
+
+        cursor.execute(
+            ORPHAN_INSTALLMENTS_QUERY.format(installments_filter=sale_filter.format(col="i.sale_id")),
+            params,
+        )
+        for sale_id, installment_no in cursor:
+            self._record(results, "orphan_installments", {"sale_id": sale_id, "installment_no": installment_no})
+
+        if track_customers:
+            # Remember whose balances need checking
+            cursor.execute(
+                f"INSERT OR IGNORE INTO temp.customer_scope SELECT customer_id FROM sales "
+                f"WHERE {sale_filter.format(col='sale_id')} AND customer_id IS NOT NULL",
+                params,
+            )
+
+    def _check_payments(self, cursor, results: dict, low_payment_id: int, high_payment_id: int) -> None:
+        for start in range(low_payment_id, high_payment_id, self.chunk_size):
+            cursor.execute(PAYMENTS_QUERY, (start, min(start + self.chunk_size, high_payment_id)))
+            for payment_id, sale_id, amount, orphan in cursor.fetchall():
+                row = {"payment_id": payment_id, "sale_id": sale_id, "amount_paid": amount}
+                if orphan:
+                    self._record(results, "orphan_payments", row)
+                if amount <= 0:
+                    self._record(results, "non_positive_payments", row)
+
+    def _check_customers(self, cursor, results: dict, everyone: bool) -> int:
+        customers_filter = (
+            "c.customer_id > ? AND c.customer_id <= ?"
+            if everyone else
+            "c.customer_id IN (SELECT customer_id FROM temp.customer_scope WHERE customer_id > ? AND customer_id <= ?)"
+        )
+        source = "customers" if everyone else "temp.customer_scope"
+        cursor.execute(f"SELECT COUNT(*), COALESCE(MAX(customer_id), 0) FROM {source}")
+        count, high = cursor.fetchone()
+        # Customers with long histories cost more; chunk them more finely
+        step = max(1, self.chunk_size // 100)
+        for start in range(0, high, step):
+            cursor.execute(CUSTOMERS_QUERY.format(customers_filter=customers_filter), (start, start + step))
+            for customer_id, balance, expected in cursor.fetchall():
+                if abs(balance - expected) > BALANCE_TOLERANCE:
+                    self._record(
+                        results,
+                        "customer_balance_mismatch",
+                        {"customer_id": customer_id, "outstanding_balance": balance, "expected": round(expected, 2)},
+                    )
+        return count
+
+    def _check_products(self, cursor, results: dict) -> int:
+        cursor.execute("SELECT product_id, name, stock FROM products WHERE stock < 0")
+        for product_id, name, stock in cursor:
+            self._record(results, "negative_stock", {"product_id": product_id, "name": name, "stock": stock})
+        cursor.execute("SELECT COUNT(*) FROM products")
+        return cursor.fetchone()[0]
+
+    # ---------- RUN ----------
+
+    def run(self, full: bool = False) -> dict:
+        """
+        Run every check and record the new high-water marks.
+        full: check everything; otherwise only what changed since the last
+        run (the first run is always full). Returns the report as a dict.
+        """
+        started_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        start = time.perf_counter()
+        results = {name: {"description": text, "violations": 0, "sample": []} for name, text in CHECKS.items()}
+
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            last = self._last_run(cursor)
+            incremental = last is not None and not full
+            last_sale_id, last_payment_id, last_event_id = last[:3] if incremental else (0, 0, 0)
+
+            # Upper bounds fixed up front: rows arriving mid-run wait for the next one
+            cursor.execute(
+                "SELECT (SELECT COALESCE(MAX(sale_id), 0) FROM sales), "
+                "(SELECT COALESCE(MAX(payment_id), 0) FROM payments), "
+                "(SELECT COALESCE(MAX(event_id), 0) FROM events)"
+            )
+            high_sale_id, high_payment_id, high_event_id = cursor.fetchone()
+
+            if incremental:
+                self._build_scope(
+                    cursor, last_sale_id, last_payment_id, last_event_id,
+                    high_sale_id, high_payment_id, high_event_id,
+                )
+                cursor.execute("SELECT COUNT(*) FROM temp.scope")
+                sales_checked = cursor.fetchone()[0]
+            else:
+                cursor.execute("SELECT COUNT(*) FROM sales WHERE sale_id <= ?", (high_sale_id,))
+                sales_checked = cursor.fetchone()[0]
+
+            cursor.execute("DROP TABLE IF EXISTS temp.customer_scope")
+            cursor.execute("CREATE TEMP TABLE customer_scope (customer_id INTEGER PRIMARY KEY)")
+            for sale_filter, params in self._sale_chunks(cursor, incremental, 0, high_sale_id):
+                self._check_sales(cursor, results, sale_filter, params, track_customers=incremental)
+                conn.commit()
+
+            self._check_payments(cursor, results, last_payment_id, high_payment_id)
+            customers_checked = self._check_customers(cursor, results, everyone=not incremental)
+            products_checked = self._check_products(cursor, results)
+
+            violations = sum(result["violations"] for result in results.values())
+            finished_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            cursor.execute(
+                """
+                INSERT INTO integrity_runs (
+                    mode, started_at, finished_at, last_sale_id, last_payment_id, last_event_id, violations
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    "incremental" if incremental else "full",
+                    started_at,
+                    finished_at,
+                    high_sale_id,
+                    high_payment_id,
+                    high_event_id,
+                    violations,
+                ),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+        return {
+            "db": self.db_name,
+            "mode": "incremental" if incremental else "full",
+            "started_at": started_at,
+            "finished_at": finished_at,
+            "elapsed_s": round(time.perf_counter() - start, 3),
+            "ok": violations == 0,
+            "violations": violations,
+            "scope": {
+                "sales_checked": sales_checked,
+                "payments_checked": high_payment_id - last_payment_id,
+                "customers_checked": customers_checked,
+                "products_checked": products_checked,
+                "since": {"sale_id": last_sale_id, "payment_id": last_payment_id, "event_id": last_event_id},
+                "until": {"sale_id": high_sale_id, "payment_id": high_payment_id, "event_id": high_event_id},
+            },
+            "checks": results,
+        }
+
+
+# ---------- BENCHMARK ----------
+
+def benchmark(num_sales: int = 10_000_000) -> dict:
+    """
+    Seed num_sales sales (a third on credit to 10,000 customers, cash ones
+    with their payment) into a temporary database, plant one violation of
+    each kind, and time a full run, an incremental run after 1,000 new
+    sales, and the peak memory of the process.
+    """
+    import os
+    import resource
+    import shutil
+    import tempfile
+
+    from store_manager import StoreManager
+
+    tmp_dir = tempfile.mkdtemp(prefix="integrity_bench_")
+    db_name = os.path.join(tmp_dir, "integrity_bench.db")
+    db_setup.create_tables(db_name)
+    with sqlite3.connect(db_name) as conn:
+        conn.executemany(
+            "INSERT INTO products (name, price, stock) VALUES (?, ?, ?)",
+            ((f"Product {i}", 10.0, 1_000_000) for i in range(200)),
+        )
+        conn.execute(
+            """
+            WITH RECURSIVE k(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM k WHERE i < 10000)
+            INSERT INTO customers (name, credit_limit, outstanding_balance, created_at)
+            SELECT 'Customer ' || i, NULL, 0, '2025-01-01 00:00:00' FROM k
+            """
+        )
+        conn.execute(
+            """
+            WITH RECURSIVE k(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM k WHERE i < ?)
+            INSERT INTO sales (product_name, quantity, total_amount, payment_type, status,
+                               due_date, sale_date, customer_id, late_fees)
+            SELECT 'Product ' || (i % 200), 1, 10.0,
+                   CASE WHEN i % 3 = 0 THEN 'Credit' ELSE 'Cash' END,
+                   CASE WHEN i % 3 = 0 THEN 'Pending' ELSE 'Paid' END,
+                   NULL, '2025-01-01 10:00:00',
+                   CASE WHEN i % 3 = 0 THEN 1 + i % 10000 END, 0
+            FROM k
+            """,
+            (num_sales,),
+        )
+        conn.execute(
+            "INSERT INTO payments (sale_id, amount_paid, payment_date, notes) "
+            "SELECT sale_id, total_amount, sale_date, 'Cash payment' FROM sales WHERE status = 'Paid'"
+        )
+        conn.execute(
+            """
+            UPDATE customers SET outstanding_balance = (
+                SELECT COALESCE(SUM(total_amount), 0) FROM sales WHERE sales.customer_id = customers.customer_id
+            )
+            """
+        )
+        # One of each kind of drift
+        conn.execute("UPDATE sales SET status = 'Paid' WHERE sale_id = 3")
+        conn.execute("INSERT INTO payments (sale_id, amount_paid, payment_date) VALUES (?, 5, '2025-01-02')",
+                     (num_sales + 1000,))
+        conn.execute("UPDATE products SET stock = -3 WHERE product_id = 1")
+        conn.commit()
+
+    checker = IntegrityChecker(db_name)
+    full = checker.run(full=True)
+
+    shop = StoreManager(db_name)
+    import contextlib
+    import io
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(1000):
+            shop.process_sale("Product 7", 1, "Credit", customer_id=42)
+    incremental = checker.run()
+
+    report = {
+        "sales": num_sales,
+        "full_s": full["elapsed_s"],
+        "full_violations": {name: r["violations"] for name, r in full["checks"].items() if r["violations"]},
+        "incremental_s": incremental["elapsed_s"],
+        "incremental_sales_checked": incremental["scope"]["sales_checked"],
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check stock, sales, payments and balances agree.")
+    parser.add_argument("command", nargs="?", default="check", choices=["check", "bench"])
+    parser.add_argument("sales", nargs="?", type=int, default=10_000_000, help="bench: sales to seed")
+    parser.add_argument("--store", default=db_setup.DEFAULT_STORE)
+    parser.add_argument("--full", action="store_true", help="check everything, not just changes since the last run")
+    parser.add_argument("--report", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        for metric, value in benchmark(args.sales).items():
+            print(f"{metric:>26}: {value}")
+        return 0
+
+    try:
+        checker = IntegrityChecker(db_setup.store_db_path(args.store))
+    except (FileNotFoundError, RuntimeError, ValueError) as e:
+        print(f"Cannot check store {args.store!r}: {e}", file=sys.stderr)
+        return 2
+    report = checker.run(full=args.full)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(
+            f"{report['mode']} check of {report['scope']['sales_checked']} sales: "
+            f"{report['violations']} violations ({report['elapsed_s']}s) -> {args.report}"
+        )
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0 if report["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
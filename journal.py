@@ -0,0 +1,387 @@
+# journal.py
+import sqlite3
+from datetime import datetime
+
+# Event types. entity_id is a product_id for STOCK/PRICE, a customer_id for
+# CREDIT_LIMIT and a sale_id otherwise.
+STOCK = "stock"        # delta = change in units on hand
+PRICE = "price"        # delta = change in unit price
+SALE = "sale"          # delta = sale total, sale opens as Pending
+PAYMENT = "payment"    # delta = amount received
+BAD_DEBT = "bad_debt"  # delta = 0, sale written off
+LATE_FEE = "late_fee"  # delta = late fees charged, sale becomes Overdue
+OVERDUE_CLEARED = "overdue_cleared"  # delta = 0, missed installments caught up
+CREDIT_LIMIT = "credit_limit"  # delta = change in a customer's limit, no limit counting as 0
+
+# Take a new snapshot once this many events have piled up since the last one
+SNAPSHOT_EVERY = 5000
+
+# Same tolerance StoreManager.record_payment uses to call a sale settled
+PAID_TOLERANCE = 0.0001
+
+
+def append(cursor, event_type: str, entity_id: int, delta: float, created_at: str) -> int:
+    """
+    Append one event using the caller's cursor, so it commits (or rolls back)
+    together with the mutation it describes. Returns the new event_id.
+    """
+    cursor.execute(
+        "INSERT INTO events (event_type, entity_id, delta, created_at) VALUES (?, ?, ?, ?)",
+        (event_type, entity_id, delta, created_at),
+    )
+    return cursor.lastrowid
+
+
+def _apply(stock: dict, sales: dict, event_type: str, entity_id: int, delta: float) -> None:
+    """Fold one event into (stock, sales) state, mirroring StoreManager's rules."""
+    if event_type == STOCK:
+        stock[entity_id] = stock.get(entity_id, 0) + int(delta)
+    elif event_type == SALE:
+        sales[entity_id] = [delta, 0.0, "Pending"]
+    elif event_type == PAYMENT:
+        sale = sales.setdefault(entity_id, [0.0, 0.0, "Pending"])
+        sale[1] += delta
+        if sale[0] - sale[1] <= PAID_TOLERANCE:
+            sale[2] = "Paid"
+        elif sale[2] != "Overdue":
+            sale[2] = "Pending"
+    elif event_type == BAD_DEBT:
+        if entity_id in sales:
+            sales[entity_id][2] = "Bad Debt"
+    elif event_type == LATE_FEE:
+        sale = sales.setdefault(entity_id, [0.0, 0.0, "Pending"])
+        sale[0] += delta
+        sale[2] = "Overdue"
+    elif event_type == OVERDUE_CLEARED:
+        if entity_id in sales and sales[entity_id][2] == "Overdue":
+            sales[entity_id][2] = "Pending"
+
+
+def ensure_baseline(conn) -> None:
+    """
+    Take a full snapshot of the current tables if the journal has none yet.
+    Rows that existed before journaling began are only known from here on.
+    Holds the write lock from the check to the commit, so two processes
+    starting on a fresh database cannot both write a baseline.
+    """
+    cursor = conn.cursor()
+    if not conn.in_transaction:
+        cursor.execute("BEGIN IMMEDIATE")
+    cursor.execute("SELECT 1 FROM journal_snapshots LIMIT 1")
+    if cursor.fetchone():
+        conn.commit()
+        return
+
+    cursor.execute("SELECT COALESCE(MAX(event_id), 0) FROM events")
+    last_event_id = cursor.fetchone()[0]
+    cursor.execute(
+        "INSERT INTO journal_snapshots (event_id, created_at) VALUES (?, ?)",
+        (last_event_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+    )
+    snapshot_id = cursor.lastrowid
+    cursor.execute(
+        "INSERT INTO snapshot_stock (product_id, snapshot_id, stock) "
+        "SELECT product_id, ?, stock FROM products",
+        (snapshot_id,),
+    )
+    cursor.execute(
+        """
+        INSERT INTO snapshot_sales (sale_id, snapshot_id, total_amount, amount_paid, status)
+        SELECT s.sale_id, ?, COALESCE(s.total_amount, 0) + COALESCE(s.late_fees, 0), COALESCE(p.paid, 0),
+               COALESCE(s.status, 'Pending')
+        FROM sales s
+        LEFT JOIN (
+            SELECT sale_id, SUM(amount_paid) AS paid FROM payments GROUP BY sale_id
+        ) p ON p.sale_id = s.sale_id
+        """,
+        (snapshot_id,),
+    )
+    conn.commit()
+
+
+class Journal:
+    """Replay and snapshot maintenance for the append-only events table."""
+
+    def __init__(self, db_name="smart_inventory.db"):
+        self.db_name = db_name
+
+    # ---------- INTERNAL UTILS ----------
+
+    def _get_connection(self):
+        return sqlite3.connect(self.db_name)
+
+    @staticmethod
+    def _latest_snapshot(cursor):
+        cursor.execute(
+            "SELECT snapshot_id, event_id FROM journal_snapshots ORDER BY snapshot_id DESC LIMIT 1"
+        )
+        return cursor.fetchone()
+
+    @staticmethod
+    def _load_snapshot(cursor, snapshot_id: int) -> tuple[dict, dict]:
+        """Full (stock, sales) state as of a snapshot: latest row per entity."""
+        cursor.execute(
+            "SELECT product_id, stock, MAX(snapshot_id) FROM snapshot_stock "
+            "WHERE snapshot_id <= ? GROUP BY product_id",
+            (snapshot_id,),
+        )
+        stock = {product_id: qty for product_id, qty, _ in cursor}
+        cursor.execute(
+            "SELECT sale_id, total_amount, amount_paid, status, MAX(snapshot_id) FROM snapshot_sales "
+            "WHERE snapshot_id <= ? GROUP BY sale_id",
+            (snapshot_id,),
+        )
+        sales = {sale_id: [total, paid, status] for sale_id, total, paid, status, _ in cursor}
+        return stock, sales
+
+    # ---------- SNAPSHOTS ----------
+
+    def take_snapshot(self) -> int | None:
+        """
+        Fold events since the previous snapshot into a new one.
+        Only products and sales touched by those events are written.
+        Returns the new snapshot_id, or None if there was nothing to fold.
+        The write lock is taken before reading the previous snapshot, so two
+        overlapping calls cannot both build on it and leave the one with the
+        older event_id as the latest.
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            previous = self._latest_snapshot(cursor)
+            if previous is None:
+                ensure_baseline(conn)
+                return None
+            prev_snapshot_id, prev_event_id = previous
+
+            cursor.execute(
+                "SELECT event_id, event_type, entity_id, delta FROM events "
+                "WHERE event_id > ? ORDER BY event_id",
+                (prev_event_id,),
+            )
+            events = cursor.fetchall()
+            if not events:
+                return None
+
+            # Seed touched entities from their latest snapshotted state
+            stock, sales = {}, {}
+            for _, event_type, entity_id, _ in events:
+                if event_type == STOCK and entity_id not in stock:
+                    cursor.execute(
+                        "SELECT stock FROM snapshot_stock WHERE product_id = ? AND snapshot_id <= ? "
+                        "ORDER BY snapshot_id DESC LIMIT 1",
+                        (entity_id, prev_snapshot_id),
+                    )
+                    row = cursor.fetchone()
+                    stock[entity_id] = row[0] if row else 0
+                elif event_type in (SALE, PAYMENT, BAD_DEBT, LATE_FEE, OVERDUE_CLEARED) and entity_id not in sales:
+                    cursor.execute(
+                        "SELECT total_amount, amount_paid, status FROM snapshot_sales "
+                        "WHERE sale_id = ? AND snapshot_id <= ? ORDER BY snapshot_id DESC LIMIT 1",
+                        (entity_id, prev_snapshot_id),
+                    )
+                    row = cursor.fetchone()
+                    if row:
+                        sales[entity_id] = list(row)
+
+            for _, event_type, entity_id, delta in events:
+                _apply(stock, sales, event_type, entity_id, delta)
+
+            cursor.execute(
+                "INSERT INTO journal_snapshots (event_id, created_at) VALUES (?, ?)",
+                (events[-1][0], datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+            )
+            snapshot_id = cursor.lastrowid
+            cursor.executemany(
+                "INSERT INTO snapshot_stock (product_id, snapshot_id, stock) VALUES (?, ?, ?)",
+                ((product_id, snapshot_id, qty) for product_id, qty in stock.items()),
+            )
+            cursor.executemany(
+                "INSERT INTO snapshot_sales (sale_id, snapshot_id, total_amount, amount_paid, status) "
+                "VALUES (?, ?, ?, ?, ?)",
+                ((sale_id, snapshot_id, *state) for sale_id, state in sales.items()),
+            )
+            conn.commit()
+            return snapshot_id
+
+    def snapshot_if_due(self, every: int = SNAPSHOT_EVERY) -> int | None:
+        """Take a snapshot if at least `every` events arrived since the last one."""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COALESCE(MAX(event_id), 0) FROM events")
+            last_event_id = cursor.fetchone()[0]
+            latest = self._latest_snapshot(cursor)
+        if latest is not None and last_event_id - latest[1] < every:
+            return None
+        return self.take_snapshot()
+
+    # ---------- REPLAY ----------
+
+    def replay(self, as_of: str | None = None) -> tuple[dict, dict]:
+        """
+        Rebuild state from the nearest snapshot plus the events after it.
+        as_of: 'YYYY-MM-DD HH:MM:SS' (inclusive), or None for the latest state.
+        Returns ({product_id: stock}, {sale_id: status}).
+        Points in time before the baseline snapshot resolve to the baseline.
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            upper_event_id = None
+            if as_of is None:
+                snapshot = self._latest_snapshot(cursor)
+            else:
+                # A snapshot never folds in events newer than its own
+                # created_at, so the last one taken by as_of is a safe base.
+                cursor.execute(
+                    "SELECT snapshot_id, event_id FROM journal_snapshots "
+                    "WHERE created_at <= ? ORDER BY snapshot_id DESC LIMIT 1",
+                    (as_of,),
+                )
+                snapshot = cursor.fetchone()
+                if snapshot is None:
+                    cursor.execute(
+                        "SELECT snapshot_id, event_id FROM journal_snapshots ORDER BY snapshot_id LIMIT 1"
+                    )
+                    snapshot = cursor.fetchone()
+                    upper_event_id = snapshot[1] if snapshot else None
+                else:
+                    # Events after the next snapshot were all written after as_of
+                    cursor.execute(
+                        "SELECT event_id FROM journal_snapshots WHERE snapshot_id > ? "
+                        "ORDER BY snapshot_id LIMIT 1",
+                        (snapshot[0],),
+                    )
+                    row = cursor.fetchone()
+                    upper_event_id = row[0] if row else None
+
+            if snapshot is None:
+                stock, sales, from_event_id = {}, {}, 0
+            else:
+                stock, sales = self._load_snapshot(cursor, snapshot[0])
+                from_event_id = snapshot[1]
+
+            cursor.execute(
+                "SELECT event_type, entity_id, delta FROM events "
+                "WHERE event_id > ? AND event_id <= COALESCE(?, event_id) "
+                "AND created_at <= COALESCE(?, created_at) ORDER BY event_id",
+                (from_event_id, upper_event_id, as_of),
+            )
+            for event_type, entity_id, delta in cursor:
+                _apply(stock, sales, event_type, entity_id, delta)
+
+        return stock, {sale_id: state[2] for sale_id, state in sales.items()}
+
+    def rebuild(self, apply: bool = False) -> dict:
+        """
+        Compare products.stock and sales.status with the replayed journal.
+        With apply=True, overwrite the tables with the journal's values.
+        Returns the differences found as {'stock': {...}, 'status': {...}}.
+        """
+        stock, statuses = self.replay()
+
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT product_id, stock FROM products")
+            stock_diff = {
+                product_id: (current, stock[product_id])
+                for product_id, current in cursor
+                if product_id in stock and stock[product_id] != current
+            }
+            cursor.execute("SELECT sale_id, status FROM sales")
+            status_diff = {
+                sale_id: (current, statuses[sale_id])
+                for sale_id, current in cursor
+                if sale_id in statuses and statuses[sale_id] != current
+            }
+
+            if apply:
+                cursor.executemany(
+                    "UPDATE products SET stock = ? WHERE product_id = ?",
+                    ((new, product_id) for product_id, (_, new) in stock_diff.items()),
+                )
+                cursor.executemany(
+                    "UPDATE sales SET status = ? WHERE sale_id = ?",
+                    ((new, sale_id) for sale_id, (_, new) in status_diff.items()),
+                )
+                conn.commit()
+
+        return {"stock": stock_diff, "status": status_diff}
+
+
+def benchmark(rounds: int = 500, repeats: int = 5) -> dict:
+    """
+    Time add_product / process_sale / record_payment with and without
+    journaling on temporary databases. Returns per-op latency in ms and the
+    journaling overhead in percent.
+    """
+    import contextlib
+    import io
+    import os
+    import statistics
+    import tempfile
+    import time
+
+    import db_setup
+    from store_manager import StoreManager
+
+    def run(journal_enabled: bool) -> float:
+        tmp_dir = tempfile.mkdtemp(prefix="journal_bench_")
+        db_name = os.path.join(tmp_dir, "journal_bench.db")
+        db_setup.create_tables(db_name)
+        shop = StoreManager(db_name, journal_enabled=journal_enabled)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for i in range(rounds):
+                shop.add_product(f"Item {i % 50}", 10.0, 5)
+                sale_id = shop.process_sale(f"Item {i % 50}", 1, "Credit")
+                shop.record_payment(sale_id, 10.0)
+            elapsed = time.perf_counter() - start
+
+        for name in os.listdir(tmp_dir):
+            os.remove(os.path.join(tmp_dir, name))
+        os.rmdir(tmp_dir)
+        return elapsed / (rounds * 3) * 1e3
+
+    # Interleave runs so disk cache warm-up does not favour either side
+    plain_runs, journaled_runs = [], []
+    for _ in range(repeats):
+        plain_runs.append(run(False))
+        journaled_runs.append(run(True))
+    plain = statistics.median(plain_runs)
+    journaled = statistics.median(journaled_runs)
+    return {
+        "plain_ms_per_op": plain,
+        "journaled_ms_per_op": journaled,
+        "overhead_pct": (journaled - plain) / plain * 100,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import db_setup
+
+    parser = argparse.ArgumentParser(description="Events journal: snapshots, replay and rebuild.")
+    parser.add_argument("command", nargs="?", default="bench", choices=["snapshot", "replay", "rebuild", "bench"])
+    parser.add_argument("as_of", nargs="?", help="replay: 'YYYY-MM-DD HH:MM:SS' (default now)")
+    parser.add_argument("--store", default=db_setup.DEFAULT_STORE)
+    parser.add_argument("--apply", action="store_true", help="rebuild: write the replayed state back")
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        for metric, value in benchmark().items():
+            print(f"{metric:>20}: {value:.3f}")
+    else:
+        path = db_setup.store_db_path(args.store)
+        if not db_setup.is_store_db(path):
+            parser.error(f"store {args.store!r} has no database at {path}")
+        store_journal = Journal(path)
+        if args.command == "snapshot":
+            print(f"Snapshot: {store_journal.take_snapshot()}")
+        elif args.command == "replay":
+            stock, statuses = store_journal.replay(args.as_of)
+            print(f"Stock as of {args.as_of or 'now'}: {stock}")
+            print(f"Sale statuses as of {args.as_of or 'now'}: {statuses}")
+        else:
+            print(store_journal.rebuild(apply=args.apply))
@@ -0,0 +1,521 @@
+# load_test.py
+"""
+Offline load generator for StoreManager.
+
+Drives process_sale, record_payment, add_product and the app.py read queries
+from several worker processes (each with several threads) against a temporary
+copy of the schema, then reports throughput, latency percentiles, lock
+timeouts and end-of-run consistency checks.
+
+    python load_test.py --processes 4 --threads 2 --rate 300 --duration 20
+    python load_test.py --replay-from smart_inventory.db   # recorded mix
+    python load_test.py --compare-reporting --history 500000
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+import dashboard
+import db_setup
+import journal
+from store_manager import StoreManager
+
+# The reads the Streamlit pages run on every rerun. The dashboard is what
+# get_dashboard() reads when data_version() has moved, which under a steady
+# stream of sales is nearly every rerun.
+READS = {
+    "dashboard": lambda conn: (dashboard.data_version(conn), dashboard.load_aggregates(conn)),
+    "pending": lambda conn: conn.execute(
+        "SELECT sale_id, product_name, total_amount, payment_type, status, due_date, sale_date "
+        "FROM sales WHERE status IN ('Pending', 'Overdue')"
+    ).fetchall(),
+    "inventory": lambda conn: conn.execute("SELECT * FROM products").fetchall(),
+}
+
+# A deliberately expensive report for the reporting-snapshot comparison
+HEAVY_REPORT = """
+    SELECT s.product_name, COUNT(*), SUM(s.total_amount), SUM(COALESCE(p.paid, 0))
+    FROM sales s
+    LEFT JOIN (SELECT sale_id, SUM(amount_paid) AS paid FROM payments GROUP BY sale_id) p
+        ON p.sale_id = s.sale_id
+    GROUP BY s.product_name
+    ORDER BY 3 DESC
+"""
+
+DEFAULT_MIX = {"sale": 60, "payment": 15, "restock": 5, "read": 20}
+
+
+# ---------- WORKLOADS ----------
+
+def parse_mix(text: str) -> dict:
+    """Parse 'sale=60,payment=15,restock=5,read=20' into a weight dict."""
+    mix = {}
+    for part in text.split(","):
+        op, _, weight = part.partition("=")
+        if op.strip() not in DEFAULT_MIX:
+            raise ValueError(f"Unknown operation in mix: {op!r}")
+        mix[op.strip()] = float(weight)
+    return mix
+
+
+def synthetic_products(count: int, seed: int = 7) -> list[tuple[str, float]]:
+    rng = random.Random(seed)
+    return [(f"SKU-{i:05d}", round(rng.uniform(1, 200), 2)) for i in range(count)]
+
+
+def recorded_workload(source_db: str) -> tuple[list[tuple[str, float]], list[tuple]]:
+    """
+    Turn the events journal of an existing database into an op list.
+    Sales keep their product, quantity and payment type; payments keep their
+    amount and are applied to a pending sale made earlier by the same thread.
+    """
+    conn = sqlite3.connect(f"file:{source_db}?mode=ro", uri=True)
+    try:
+        products = conn.execute("SELECT name, price FROM products").fetchall()
+        rows = conn.execute(
+            """
+            SELECT e.event_type, e.delta, s.product_name, s.quantity, s.payment_type
+            FROM events e
+            LEFT JOIN sales s ON s.sale_id = e.entity_id AND e.event_type IN ('sale', 'payment')
+            WHERE e.event_type IN ('sale', 'payment', 'stock')
+            ORDER BY e.event_id
+            """
+        ).fetchall()
+    finally:
+        conn.close()
+
+    ops = []
+    for event_type, delta, product_name, quantity, payment_type in rows:
+        if event_type == "sale":
+            ops.append(("sale", product_name, quantity, payment_type))
+        elif event_type == "payment" and payment_type != "Cash":
+            ops.append(("payment", delta))
+        elif event_type == "stock" and delta > 0:
+            ops.append(("restock", None, int(delta)))
+    return products, ops
+
+
+# ---------- WORKER ----------
+
+def _thread_loop(shop, ops_source, rate_per_thread, deadline, rng, products, result, lock):
+    interval = 1.0 / rate_per_thread if rate_per_thread > 0 else 0.0
+    next_at = time.perf_counter()
+    pending_sales = []
+
+    while time.perf_counter() < deadline:
+        op = ops_source(rng)
+        if op is None:
+            break
+
+        if interval:
+            next_at += interval
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        kind = op[0]
+        start = time.perf_counter()
+        outcome = "ok"
+        sold = restocked = None
+        try:
+            if kind == "sale":
+                _, name, quantity, payment_type = op
+                sale_id = shop.process_sale(name, quantity, payment_type)
+                if sale_id is None:
+                    outcome = "rejected"
+                else:
+                    sold = (name, quantity)
+                    if payment_type != "Cash":
+                        pending_sales.append(sale_id)
+            elif kind == "payment":
+                if not pending_sales:
+                    continue
+                sale_id = rng.choice(pending_sales)
+                shop.record_payment(sale_id, op[1])
+            elif kind == "restock":
+                name = op[1] or rng.choice(products)[0]
+                price = dict(products).get(name, 1.0)
+                shop.add_product(name, price, op[2])
+                restocked = (name, op[2])
+            else:
+                with shop.reporting_connection() as conn:
+                    READS[op[1]](conn)
+        except sqlite3.OperationalError as e:
+            outcome = "lock_timeout" if "locked" in str(e) or "busy" in str(e) else "error"
+        except Exception:
+            outcome = "error"
+        elapsed_ms = (time.perf_counter() - start) * 1e3
+
+        with lock:
+            label = kind if kind != "read" else f"read:{op[1]}"
+            result["latencies"][label].append(elapsed_ms)
+            result["outcomes"][(label, outcome)] += 1
+            if sold:
+                result["sold"][sold[0]] += sold[1]
+            if restocked:
+                result["restocked"][restocked[0]] += restocked[1]
+
+
+def _worker(worker_id, db_name, threads, rate, duration, mix, products, recorded_ops, report_refresh, queue):
+    # StoreManager reports every mutation with print(); keep the console quiet
+    sys.stdout = open(os.devnull, "w")
+
+    shop = StoreManager(db_name, report_refresh_interval=report_refresh)
+    result = {
+        "latencies": defaultdict(list),
+        "outcomes": Counter(),
+        "sold": Counter(),
+        "restocked": Counter(),
+    }
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    ops_lock = threading.Lock()
+    op_names = list(mix)
+    weights = [mix[name] for name in op_names]
+
+    if recorded_ops is not None:
+        shared = iter(recorded_ops)
+
+        def ops_source(rng):
+            with ops_lock:
+                return next(shared, None)
+    else:
+        def ops_source(rng):
+            kind = rng.choices(op_names, weights)[0]
+            if kind == "sale":
+                name = rng.choice(products)[0]
+                return ("sale", name, rng.randint(1, 3), rng.choice(["Cash", "Cash", "EMI", "Credit"]))
+            if kind == "payment":
+                return ("payment", round(rng.uniform(5, 50), 2))
+            if kind == "restock":
+                return ("restock", None, rng.randint(10, 50))
+            return ("read", rng.choice(list(READS)))
+
+    workers = []
+    for t in range(threads):
+        rng = random.Random(worker_id * 1000 + t)
+        workers.append(
+            threading.Thread(
+                target=_thread_loop,
+                args=(shop, ops_source, rate / threads, deadline, rng, products, result, lock),
+            )
+        )
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    queue.put(
+        {
+            "latencies": dict(result["latencies"]),
+            "outcomes": dict(result["outcomes"]),
+            "sold": dict(result["sold"]),
+            "restocked": dict(result["restocked"]),
+        }
+    )
+
+
+def _report_worker(db_name, duration, report_refresh, queue):
+    """Run HEAVY_REPORT back to back, the way a busy back office would."""
+    shop = StoreManager(db_name, report_refresh_interval=report_refresh)
+    latencies = []
+    outcomes = Counter()
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            with shop.reporting_connection() as conn:
+                conn.execute(HEAVY_REPORT).fetchall()
+            outcomes[("report:heavy", "ok")] += 1
+        except sqlite3.OperationalError:
+            outcomes[("report:heavy", "lock_timeout")] += 1
+        latencies.append((time.perf_counter() - start) * 1e3)
+    queue.put({"latencies": {"report:heavy": latencies}, "outcomes": dict(outcomes), "sold": {}, "restocked": {}})
+
+
+def seed_history(db_name: str, rows: int) -> None:
+    """
+    Bulk-insert old Pending sales so reports have something heavy to chew on.
+    They use product names outside the live catalog and carry no journal
+    events, so the end-of-run invariants ignore them.
+    """
+    with sqlite3.connect(db_name) as conn:
+        conn.execute(
+            """
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+            INSERT INTO sales (product_name, quantity, total_amount, payment_type, status, due_date, sale_date)
+            SELECT 'HISTORY-' || (i % 500), 1, 10.0, 'Credit', 'Pending', '2024-01-31', '2024-01-01 10:00:00'
+            FROM n
+            """,
+            (rows,),
+        )
+        conn.commit()
+
+
+# ---------- REPORTING ----------
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def check_invariants(db_name: str, initial_stock: int, sold: Counter, restocked: Counter) -> dict:
+    """End-of-run consistency checks. Every value should be 0 / empty."""
+    conn = sqlite3.connect(db_name)
+    try:
+        stock = dict(conn.execute("SELECT name, stock FROM products"))
+        sales_units = dict(conn.execute("SELECT product_name, SUM(quantity) FROM sales GROUP BY product_name"))
+        stock_mismatch = {
+            name: {"expected": initial_stock + restocked[name] - sold[name], "actual": qty}
+            for name, qty in stock.items()
+            if qty != initial_stock + restocked[name] - sold[name]
+        }
+        sales_mismatch = {
+            name: {"reported": sold[name], "in_sales_table": units}
+            for name, units in sales_units.items()
+            if name in stock and units != sold[name]
+        }
+        negative_stock = [name for name, qty in stock.items() if qty < 0]
+        (bad_status,) = conn.execute(
+            """
+            SELECT COUNT(*) FROM sales s
+            LEFT JOIN (SELECT sale_id, SUM(amount_paid) AS paid FROM payments GROUP BY sale_id) p
+                ON p.sale_id = s.sale_id
+            WHERE (s.status = 'Paid' AND COALESCE(p.paid, 0) < s.total_amount + s.late_fees - 0.0001)
+               OR (s.status IN ('Pending', 'Overdue')
+                   AND COALESCE(p.paid, 0) >= s.total_amount + s.late_fees - 0.0001)
+            """
+        ).fetchone()
+    finally:
+        conn.close()
+
+    journal_diff = journal.Journal(db_name).rebuild()
+    return {
+        "stock_mismatch": stock_mismatch,
+        "sales_mismatch": sales_mismatch,
+        "negative_stock": negative_stock,
+        "status_mismatch": bad_status,
+        "journal_drift": {key: len(value) for key, value in journal_diff.items()},
+    }
+
+
+def broken_invariants(invariants: dict) -> list[str]:
+    """Names of the checks from check_invariants() that found something."""
+    return [
+        name for name, value in invariants.items()
+        if (any(value.values()) if name == "journal_drift" else value)
+    ]
+
+
+def run(
+    processes: int = 4,
+    threads: int = 2,
+    rate: float = 200.0,
+    duration: float = 10.0,
+    mix: dict | None = None,
+    num_products: int = 200,
+    initial_stock: int = 100_000,
+    replay_from: str | None = None,
+    db_name: str | None = None,
+    report_refresh: float | None = None,
+    report_workers: int = 0,
+    history_rows: int = 0,
+) -> dict:
+    """
+    Run one load test and return the report as a dict.
+    report_refresh: route reads through a reporting snapshot refreshed this
+    often (None = read the primary file). report_workers: extra processes
+    running HEAVY_REPORT for the whole test.
+    """
+    tmp_dir = None
+    if db_name is None:
+        tmp_dir = tempfile.mkdtemp(prefix="load_test_")
+        db_name = os.path.join(tmp_dir, "load_test.db")
+    db_setup.create_tables(db_name)
+
+    recorded_ops = None
+    if replay_from:
+        products, recorded_ops = recorded_workload(replay_from)
+    else:
+        products = synthetic_products(num_products)
+
+    # Seed through the journal too, so the replay check starts from the same stock
+    with sqlite3.connect(db_name) as conn:
+        cursor = conn.cursor()
+        seeded_at = time.strftime("%Y-%m-%d %H:%M:%S")
+        for name, price in products:
+            cursor.execute(
+                "INSERT INTO products (name, price, stock) VALUES (?, ?, ?)",
+                (name, price, initial_stock),
+            )
+            journal.append(cursor, journal.STOCK, cursor.lastrowid, initial_stock, seeded_at)
+        conn.commit()
+
+    if history_rows:
+        seed_history(db_name, history_rows)
+
+    queue = mp.Queue()
+    per_process_ops = None
+    workers = []
+    for worker_id in range(processes):
+        if recorded_ops is not None:
+            per_process_ops = recorded_ops[worker_id::processes]
+        workers.append(
+            mp.Process(
+                target=_worker,
+                args=(
+                    worker_id, db_name, threads, rate / processes, duration,
+                    mix or DEFAULT_MIX, products, per_process_ops, report_refresh, queue,
+                ),
+            )
+        )
+    for _ in range(report_workers):
+        workers.append(mp.Process(target=_report_worker, args=(db_name, duration, report_refresh, queue)))
+
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    results = [queue.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    wall_s = time.perf_counter() - started
+
+    latencies = defaultdict(list)
+    outcomes, sold, restocked = Counter(), Counter(), Counter()
+    for result in results:
+        for label, values in result["latencies"].items():
+            latencies[label].extend(values)
+        outcomes.update(result["outcomes"])
+        sold.update(result["sold"])
+        restocked.update(result["restocked"])
+
+    ops = {}
+    for label, values in sorted(latencies.items()):
+        values.sort()
+        ops[label] = {
+            "count": len(values),
+            "p50_ms": percentile(values, 50),
+            "p95_ms": percentile(values, 95),
+            "p99_ms": percentile(values, 99),
+            **{outcome: n for (op, outcome), n in outcomes.items() if op == label},
+        }
+
+    total_ok = sum(
+        n for (label, outcome), n in outcomes.items()
+        if outcome in ("ok", "rejected") and not label.startswith("report:")
+    )
+    report = {
+        "config": {
+            "processes": processes,
+            "threads": threads,
+            "target_rate": rate,
+            "duration_s": duration,
+            "workload": f"recorded:{replay_from}" if replay_from else "synthetic",
+            "reads_from": f"snapshot/{report_refresh}s" if report_refresh is not None else "primary",
+            "report_workers": report_workers,
+        },
+        "wall_s": wall_s,
+        "throughput_ops_s": total_ok / wall_s if wall_s else 0.0,
+        "lock_timeouts": sum(n for (_, outcome), n in outcomes.items() if outcome == "lock_timeout"),
+        "errors": sum(n for (_, outcome), n in outcomes.items() if outcome == "error"),
+        "ops": ops,
+        "invariants": check_invariants(db_name, initial_stock, sold, restocked),
+    }
+
+    if tmp_dir:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return report
+
+
+def print_report(report: dict) -> None:
+    config = report["config"]
+    print(
+        f"\n--- LOAD TEST ({config['workload']}, {config['processes']} proc x {config['threads']} threads, "
+        f"target {config['target_rate']:.0f} ops/s for {config['duration_s']:.0f}s, "
+        f"reads from {config['reads_from']}, {config['report_workers']} report workers) ---"
+    )
+    print(f"Throughput:    {report['throughput_ops_s']:.1f} ops/s over {report['wall_s']:.1f}s")
+    print(f"Lock timeouts: {report['lock_timeouts']}    Errors: {report['errors']}")
+    print(f"\n{'operation':<16}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for label, stats in report["ops"].items():
+        print(
+            f"{label:<16}{stats['count']:>8}{stats['p50_ms']:>10.2f}"
+            f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}"
+        )
+
+    broken = broken_invariants(report["invariants"])
+    print("\nInvariants:", "OK" if not broken else f"BROKEN -> {', '.join(broken)}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline load test for StoreManager.")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=2, help="threads per process")
+    parser.add_argument("--rate", type=float, default=200.0, help="target ops/s across all workers (0 = unthrottled)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--mix", type=parse_mix, default=None, help="e.g. sale=60,payment=15,restock=5,read=20")
+    parser.add_argument("--products", type=int, default=200, help="synthetic catalog size")
+    parser.add_argument("--replay-from", help="database whose events journal supplies a recorded workload")
+    parser.add_argument("--report-refresh", type=float, default=None, help="read from a snapshot refreshed every N s")
+    parser.add_argument("--report-workers", type=int, default=0, help="processes running a heavy report throughout")
+    parser.add_argument("--history", type=int, default=0, help="old sales rows to preload for the reports")
+    parser.add_argument(
+        "--compare-reporting",
+        action="store_true",
+        help="run twice with heavy reports, on the primary and then on a snapshot, and compare checkout latency",
+    )
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    settings = dict(
+        processes=args.processes,
+        threads=args.threads,
+        rate=args.rate,
+        duration=args.duration,
+        mix=args.mix,
+        num_products=args.products,
+        replay_from=args.replay_from,
+        history_rows=args.history,
+    )
+    if args.compare_reporting:
+        report_workers = args.report_workers or 2
+        reports = {
+            "primary": run(**settings, report_workers=report_workers),
+            "snapshot": run(**settings, report_workers=report_workers, report_refresh=args.report_refresh or 5.0),
+        }
+        for report in reports.values():
+            print_report(report)
+        print(f"\n{'checkout (sale)':<16}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'reports':>10}")
+        for source, report in reports.items():
+            sale = report["ops"].get("sale", {})
+            heavy = report["ops"].get("report:heavy", {})
+            print(
+                f"{'reports on ' + source:<16}{sale.get('p50_ms', 0):>10.2f}{sale.get('p95_ms', 0):>10.2f}"
+                f"{sale.get('p99_ms', 0):>10.2f}{heavy.get('count', 0):>10}"
+            )
+    else:
+        reports = {
+            "run": run(**settings, report_refresh=args.report_refresh, report_workers=args.report_workers)
+        }
+        print_report(reports["run"])
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports if args.compare_reporting else reports["run"], f, indent=2)
+
+    return 1 if any(broken_invariants(report["invariants"]) for report in reports.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
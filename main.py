@@ -1,14 +1,14 @@
 # main.py (Updated for EMI & Bad Debt Support)
 import db_setup
+import emi
 from store_manager import StoreManager
 import dashboard  # Make sure this file still exists or remove this line if using Streamlit only
 import sys
 import sqlite3
 import pandas as pd
 
-# 1. Setup
-db_setup.create_tables()
-my_shop = StoreManager()
+# 1. Setup (optional store id: python main.py <store_id>)
+my_shop = StoreManager.for_store(sys.argv[1] if len(sys.argv) > 1 else db_setup.DEFAULT_STORE)
 
 def print_menu():
     print("\n--- 🏦 MAYANK'S ENTERPRISE STORE SYSTEM ---")
@@ -28,8 +28,8 @@ def manage_payments_menu():
     choice = input("👉 Select Option: ")
     
     if choice == '1':
-        conn = sqlite3.connect('smart_inventory.db')
-        df = pd.read_sql_query("SELECT * FROM sales WHERE status='Pending'", conn)
+        conn = sqlite3.connect(my_shop.db_name)
+        df = pd.read_sql_query("SELECT * FROM sales WHERE status IN ('Pending', 'Overdue')", conn)
         conn.close()
         if df.empty:
             print("✅ No pending payments!")
@@ -70,18 +70,26 @@ while True:
             
             print("\nSelect Payment Type:")
             print("1. Cash (Paid Now)")
-            print("2. EMI (Due in 30 Days)")
+            print("2. EMI (Monthly Installments)")
             print("3. Credit (Due in 15 Days)")
             pay_choice = input("👉 Choice (1-3): ")
             
             p_type = "Cash"
             if pay_choice == '2': p_type = "EMI"
             elif pay_choice == '3': p_type = "Credit"
-            
-            my_shop.process_sale(p_name, p_qty, p_type)
+
+            months = emi.DEFAULT_MONTHS
+            if p_type == "EMI":
+                months_text = input(f"Installments in months (default {emi.DEFAULT_MONTHS}): ").strip()
+                months = int(months_text) if months_text else emi.DEFAULT_MONTHS
+
+            if months < 1:
+                print("⚠️ Error: An EMI needs at least one installment.")
+            else:
+                my_shop.process_sale(p_name, p_qty, p_type, emi_months=months)
             
         except ValueError:
-            print("⚠️ Error: Quantity must be a number.")
+            print("⚠️ Error: Quantity and installments must be numbers.")
 
     elif choice == '3':
         # NEW: FINANCE MENU
@@ -91,7 +99,7 @@ while True:
     elif choice == '4':
         # DASHBOARD
         print("📊 Generating Report...")
-        dashboard.show_sales_chart()
+        dashboard.show_sales_chart(my_shop.db_name)
 
     elif choice == '5':
         print("👋 Shop Closed.")
@@ -1,18 +1,102 @@
 # store_manager.py
+import os
 import sqlite3
+import tempfile
+import threading
+import time
+import weakref
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from pathlib import Path
+
+import db_setup
+import emi
+import journal
 
 
 class StoreManager:
     """Business logic layer for inventory, sales, and payments."""
 
-    def __init__(self, db_name="smart_inventory.db"):
+    def __init__(
+        self,
+        db_name="smart_inventory.db",
+        journal_enabled: bool = True,
+        report_refresh_interval: float | None = None,
+        store_id: str | None = None,
+    ):
+        """
+        journal_enabled: append every mutation to the events journal.
+        report_refresh_interval: seconds between refreshes of the read-only
+        reporting snapshot. None sends reporting queries to the primary file.
+        store_id: the store this database belongs to, if any (see for_store).
+        """
         self.db_name = db_name
+        self.store_id = store_id
+        self.journal_enabled = journal_enabled
+        self._last_event_id = 0
+        self._snapshot_event_id = None
+        # A cached instance is shared by every session thread
+        self._journal_lock = threading.Lock()
+
+        self.report_refresh_interval = report_refresh_interval
+        self._report_path = None
+        self._report_taken_at = None
+        self._report_readers = {}
+        self._report_files = set()
+        self._report_lock = threading.Lock()
+        self._report_refresh_lock = threading.Lock()
+        weakref.finalize(self, _remove_snapshots, self._report_files)
+        if report_refresh_interval is not None:
+            # WAL lets the backup read a consistent copy without blocking checkout
+            with self._get_connection() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+
+    @classmethod
+    def for_store(cls, store_id: str = db_setup.DEFAULT_STORE, **kwargs) -> "StoreManager":
+        """StoreManager bound to one store's own database file (created if missing)."""
+        return cls(db_setup.create_store(store_id), store_id=store_id, **kwargs)
 
     # ---------- INTERNAL UTILS ----------
 
     def _get_connection(self):
-        return sqlite3.connect(self.db_name)
+        conn = sqlite3.connect(self.db_name)
+        # SQLite leaves REFERENCES unenforced unless asked, per connection
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    @staticmethod
+    def _begin_write(cursor) -> None:
+        """
+        Take the write lock before reading the rows we are about to update,
+        so concurrent tills cannot both read the same stock and lose a sale.
+        """
+        cursor.execute("BEGIN IMMEDIATE")
+
+    def _log_event(self, cursor, event_type: str, entity_id: int, delta: float, created_at: str) -> None:
+        """Append to the events journal inside the caller's transaction."""
+        if self.journal_enabled:
+            event_id = journal.append(cursor, event_type, entity_id, delta, created_at)
+            with self._journal_lock:
+                self._last_event_id = max(self._last_event_id, event_id)
+
+    def _after_commit(self) -> None:
+        """
+        Housekeeping that must not hold up the mutation's own transaction.
+        The journal is only asked about snapshots once this instance has
+        written SNAPSHOT_EVERY events since it last checked.
+        """
+        if not self.journal_enabled:
+            return
+        with self._journal_lock:
+            if not self._last_event_id:
+                return
+            if self._snapshot_event_id is None:
+                self._snapshot_event_id = self._last_event_id
+            if self._last_event_id - self._snapshot_event_id < journal.SNAPSHOT_EVERY:
+                return
+            # Claim this round before letting go, so only one thread snapshots
+            self._snapshot_event_id = self._last_event_id
+        journal.Journal(self.db_name).snapshot_if_due()
 
     # ---------- INVENTORY ----------
 
@@ -27,18 +111,25 @@ class StoreManager:
 
         with self._get_connection() as conn:
             cursor = conn.cursor()
+            self._begin_write(cursor)
+            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
             # Check if product exists
-            cursor.execute("SELECT stock FROM products WHERE name = ?", (name,))
+            cursor.execute("SELECT product_id, price, stock FROM products WHERE name = ?", (name,))
             row = cursor.fetchone()
 
             if row:
                 # Update existing stock
-                new_stock = row[0] + stock
+                product_id, old_price, old_stock = row
+                new_stock = old_stock + stock
                 cursor.execute(
                     "UPDATE products SET price = ?, stock = ? WHERE name = ?",
                     (price, new_stock, name),
                 )
+                if stock:
+                    self._log_event(cursor, journal.STOCK, product_id, stock, now)
+                if price != old_price:
+                    self._log_event(cursor, journal.PRICE, product_id, price - old_price, now)
                 print(f"Updated product '{name}': price={price}, stock={new_stock}")
             else:
                 # Insert new product
@@ -46,26 +137,138 @@ class StoreManager:
                     "INSERT INTO products (name, price, stock) VALUES (?, ?, ?)",
                     (name, price, stock),
                 )
+                product_id = cursor.lastrowid
+                self._log_event(cursor, journal.STOCK, product_id, stock, now)
+                self._log_event(cursor, journal.PRICE, product_id, price, now)
                 print(f"Added new product '{name}': price={price}, stock={stock}")
 
             conn.commit()
 
+        self._after_commit()
+
     # ---------- SALES ----------
 
-    def process_sale(self, product_name: str, quantity: int, payment_type: str = "Cash") -> int | None:
+    @staticmethod
+    def _normalize_payment_type(payment_type: str) -> str:
+        payment_type = payment_type.capitalize()
+        if payment_type not in ("Cash", "Emi", "Credit"):
+            payment_type = "Cash"
+
+        # Normalize payment_type to consistent values
+        if payment_type == "Emi":
+            payment_type = "EMI"
+        return payment_type
+
+    def _insert_sale(
+        self,
+        cursor,
+        product_id: int,
+        product_name: str,
+        quantity: int,
+        unit_price: float,
+        payment_type: str,
+        sale_date: str,
+        client_uuid: str | None = None,
+        customer_id: int | None = None,
+        emi_months: int = emi.DEFAULT_MONTHS,
+        logged_at: str | None = None,
+    ) -> tuple[int, str, float]:
+        """
+        Write a sale inside the caller's transaction: decrement stock, insert
+        the sale row and, for cash, its payment; for EMI its installment
+        schedule; on EMI/Credit add the bill to the customer's outstanding
+        balance. Stock and credit checks are the caller's job.
+        logged_at: journal timestamp when it differs from sale_date.
+        Returns (sale_id, status, total_bill).
+        """
+        logged_at = logged_at or sale_date
+        total_bill = unit_price * quantity
+        status = "Paid" if payment_type == "Cash" else "Pending"
+        due_date = None
+
+        if payment_type == "Credit":
+            sold_at = datetime.strptime(sale_date, "%Y-%m-%d %H:%M:%S")
+            due_date = (sold_at + timedelta(days=15)).strftime("%Y-%m-%d")
+
+        # 1. Update stock
+        cursor.execute(
+            "UPDATE products SET stock = stock - ? WHERE product_id = ?",
+            (quantity, product_id),
+        )
+
+        # 2. Insert sale row
+        cursor.execute(
+            """
+            INSERT INTO sales (
+                product_name, quantity, total_amount,
+                payment_type, status, due_date, sale_date, client_uuid, customer_id
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                product_name,
+                quantity,
+                total_bill,
+                payment_type,
+                status,
+                due_date,
+                sale_date,
+                client_uuid,
+                customer_id,
+            ),
+        )
+        sale_id = cursor.lastrowid
+        self._log_event(cursor, journal.STOCK, product_id, -quantity, logged_at)
+        self._log_event(cursor, journal.SALE, sale_id, total_bill, logged_at)
+
+        if payment_type == "EMI":
+            # Due date tracks the next unpaid installment from here on
+            due_date = emi.create_schedule(cursor, sale_id, total_bill, sale_date, emi_months)
+            cursor.execute("UPDATE sales SET due_date = ? WHERE sale_id = ?", (due_date, sale_id))
+
+        # 3. If cash, record immediate payment; otherwise the customer owes it
+        if payment_type == "Cash":
+            cursor.execute(
+                """
+                INSERT INTO payments (sale_id, amount_paid, payment_date, notes, customer_id)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (sale_id, total_bill, sale_date, "Cash payment", customer_id),
+            )
+            self._log_event(cursor, journal.PAYMENT, sale_id, total_bill, logged_at)
+        elif customer_id is not None:
+            cursor.execute(
+                "UPDATE customers SET outstanding_balance = outstanding_balance + ? WHERE customer_id = ?",
+                (total_bill, customer_id),
+            )
+
+        return sale_id, status, total_bill
+
+    def process_sale(
+        self,
+        product_name: str,
+        quantity: int,
+        payment_type: str = "Cash",
+        customer_id: int | None = None,
+        emi_months: int = emi.DEFAULT_MONTHS,
+    ) -> int | None:
         """
         Process a sale, update stock, and create a sales record.
         payment_type: 'Cash', 'EMI', or 'Credit'
+        customer_id: the buyer, if known. EMI/Credit sales to a customer are
+        refused if they would take the customer over their credit limit.
+        emi_months: number of monthly installments for an EMI sale.
         Returns the sale_id if successful, otherwise None.
         """
         product_name = product_name.strip()
 
         with self._get_connection() as conn:
             cursor = conn.cursor()
+            self._begin_write(cursor)
 
             # Get product details
             cursor.execute(
-                "SELECT stock, price FROM products WHERE name = ?",
+                "SELECT product_id, stock, price FROM products WHERE name = ?",
                 (product_name,),
             )
             row = cursor.fetchone()
@@ -74,7 +277,7 @@ class StoreManager:
                 print(f"Product '{product_name}' not found.")
                 return None
 
-            current_stock, price = row
+            product_id, current_stock, price = row
 
             if quantity <= 0:
                 print("Quantity must be positive.")
@@ -87,64 +290,37 @@ class StoreManager:
                 )
                 return None
 
-            total_bill = price * quantity
-            new_stock = current_stock - quantity
-
-            # Payment details
-            payment_type = payment_type.capitalize()
-            if payment_type not in ("Cash", "Emi", "Credit"):
-                payment_type = "Cash"
-
-            # Normalize payment_type to consistent values
-            if payment_type == "Emi":
-                payment_type = "EMI"
-
-            status = "Paid" if payment_type == "Cash" else "Pending"
-            due_date = None
-
-            if payment_type == "EMI":
-                due_date = (datetime.now() + timedelta(days=30)).strftime("%Y-%m-%d")
-            elif payment_type == "Credit":
-                due_date = (datetime.now() + timedelta(days=15)).strftime("%Y-%m-%d")
-
+            payment_type = self._normalize_payment_type(payment_type)
             sale_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-            # 1. Update stock
-            cursor.execute(
-                "UPDATE products SET stock = ? WHERE name = ?",
-                (new_stock, product_name),
-            )
-
-            # 2. Insert sale row
-            cursor.execute(
-                """
-                INSERT INTO sales (
-                    product_name, quantity, total_amount,
-                    payment_type, status, due_date, sale_date
-                )
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    product_name,
-                    quantity,
-                    total_bill,
-                    payment_type,
-                    status,
-                    due_date,
-                    sale_date,
-                ),
-            )
-            sale_id = cursor.lastrowid
-
-            # 3. If cash, record immediate payment
-            if payment_type == "Cash":
+            if customer_id is not None:
+                # Balance is maintained per sale/payment: one primary-key read
                 cursor.execute(
-                    """
-                    INSERT INTO payments (sale_id, amount_paid, payment_date, notes)
-                    VALUES (?, ?, ?, ?)
-                    """,
-                    (sale_id, total_bill, sale_date, "Cash payment"),
+                    "SELECT name, credit_limit, outstanding_balance FROM customers WHERE customer_id = ?",
+                    (customer_id,),
                 )
+                customer = cursor.fetchone()
+                if not customer:
+                    print(f"Customer id {customer_id} not found.")
+                    return None
+
+                name, credit_limit, outstanding = customer
+                if (
+                    payment_type != "Cash"
+                    and credit_limit is not None
+                    and outstanding + price * quantity > credit_limit + 0.0001
+                ):
+                    print(
+                        f"Credit limit exceeded for '{name}'. "
+                        f"Limit={credit_limit}, Outstanding={outstanding}, Bill={price * quantity}"
+                    )
+                    return None
+
+            sale_id, status, total_bill = self._insert_sale(
+                cursor, product_id, product_name, quantity, price, payment_type, sale_date,
+                customer_id=customer_id,
+                emi_months=emi_months,
+            )
 
             conn.commit()
 
@@ -153,10 +329,86 @@ class StoreManager:
                 f"type={payment_type}, status={status}, total={total_bill}"
             )
 
-            return sale_id
+        self._after_commit()
+        return sale_id
 
     # ---------- PAYMENTS ----------
 
+    def _insert_payment(
+        self,
+        cursor,
+        sale_id: int,
+        amount_paid: float,
+        payment_date: str,
+        client_uuid: str | None = None,
+        logged_at: str | None = None,
+    ) -> tuple[float, float, str] | None:
+        """
+        Record a payment inside the caller's transaction, allocate it to any
+        EMI installments and update the sale status.
+        logged_at: journal timestamp when it differs from payment_date.
+        Returns (total_paid, remaining, status), or None if the sale does not
+        exist.
+        """
+        logged_at = logged_at or payment_date
+        # Get sale info; late fees are owed on top of the bill
+        cursor.execute(
+            "SELECT total_amount + late_fees, status, customer_id, payment_type FROM sales WHERE sale_id = ?",
+            (sale_id,),
+        )
+        sale_row = cursor.fetchone()
+        if not sale_row:
+            return None
+
+        total_amount, current_status, customer_id, payment_type = sale_row
+
+        # Sum of previous payments
+        cursor.execute(
+            "SELECT COALESCE(SUM(amount_paid), 0) FROM payments WHERE sale_id = ?",
+            (sale_id,),
+        )
+        already_paid = cursor.fetchone()[0] or 0.0
+
+        new_total_paid = already_paid + amount_paid
+        remaining = total_amount - new_total_paid
+
+        # Insert payment record
+        cursor.execute(
+            """
+            INSERT INTO payments (sale_id, amount_paid, payment_date, notes, client_uuid, customer_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (sale_id, amount_paid, payment_date, "EMI/Credit payment", client_uuid, customer_id),
+        )
+        self._log_event(cursor, journal.PAYMENT, sale_id, amount_paid, logged_at)
+
+        # Overpayment beyond the bill does not push the balance below what is owed
+        settled = min(amount_paid, max(total_amount - already_paid, 0.0))
+        if customer_id is not None and settled > 0:
+            cursor.execute(
+                "UPDATE customers SET outstanding_balance = outstanding_balance - ? WHERE customer_id = ?",
+                (settled, customer_id),
+            )
+
+        if payment_type == "EMI":
+            emi.allocate_payment(cursor, sale_id, amount_paid, payment_date)
+
+        # Update sale status: Paid once settled; an Overdue sale stays Overdue
+        # until its missed installments are paid off
+        if remaining <= 0.0001:
+            new_status = "Paid"
+        elif current_status == "Overdue" and emi.has_overdue(cursor, sale_id):
+            new_status = "Overdue"
+        else:
+            new_status = "Pending"
+            if current_status == "Overdue":
+                self._log_event(cursor, journal.OVERDUE_CLEARED, sale_id, 0, logged_at)
+        cursor.execute(
+            "UPDATE sales SET status = ? WHERE sale_id = ?",
+            (new_status, sale_id),
+        )
+        return new_total_paid, remaining, new_status
+
     def record_payment(self, sale_id: int, amount_paid: float) -> None:
         """
         Record a payment against an existing sale (for EMI or Credit).
@@ -168,46 +420,15 @@ class StoreManager:
 
         with self._get_connection() as conn:
             cursor = conn.cursor()
+            self._begin_write(cursor)
 
-            # Get sale info
-            cursor.execute(
-                "SELECT total_amount, status FROM sales WHERE sale_id = ?",
-                (sale_id,),
-            )
-            sale_row = cursor.fetchone()
-            if not sale_row:
+            payment_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            result = self._insert_payment(cursor, sale_id, amount_paid, payment_date)
+            if result is None:
                 print(f"Sale id {sale_id} not found.")
                 return
 
-            total_amount, current_status = sale_row
-
-            # Sum of previous payments
-            cursor.execute(
-                "SELECT COALESCE(SUM(amount_paid), 0) FROM payments WHERE sale_id = ?",
-                (sale_id,),
-            )
-            already_paid = cursor.fetchone()[0] or 0.0
-
-            new_total_paid = already_paid + amount_paid
-            remaining = total_amount - new_total_paid
-
-            # Insert payment record
-            payment_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            cursor.execute(
-                """
-                INSERT INTO payments (sale_id, amount_paid, payment_date, notes)
-                VALUES (?, ?, ?, ?)
-                """,
-                (sale_id, amount_paid, payment_date, "EMI/Credit payment"),
-            )
-
-            # Update sale status if fully paid
-            new_status = "Paid" if remaining <= 0.0001 else "Pending"
-            cursor.execute(
-                "UPDATE sales SET status = ? WHERE sale_id = ?",
-                (new_status, sale_id),
-            )
-
+            new_total_paid, remaining, new_status = result
             conn.commit()
 
             print(
@@ -215,6 +436,19 @@ class StoreManager:
                 f"paid={new_total_paid}, remaining={max(0, remaining)}, status={new_status}"
             )
 
+        self._after_commit()
+
+    def installment_schedule(self, sale_id: int) -> list[dict]:
+        """The EMI installments of a sale, oldest first (empty for other sales)."""
+        with self._get_connection() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(
+                "SELECT installment_no, due_date, amount_due, late_fee, amount_paid, status, paid_date "
+                "FROM installments WHERE sale_id = ? ORDER BY installment_no",
+                (sale_id,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
     def mark_bad_debt(self, sale_id: int) -> None:
         """
         Mark a sale as bad debt (unrecoverable).
@@ -225,5 +459,391 @@ class StoreManager:
                 "UPDATE sales SET status = 'Bad Debt' WHERE sale_id = ?",
                 (sale_id,),
             )
+            if cursor.rowcount:
+                self._log_event(
+                    cursor,
+                    journal.BAD_DEBT,
+                    sale_id,
+                    0,
+                    datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                )
             conn.commit()
             print(f"Sale {sale_id} marked as Bad Debt.")
+
+        self._after_commit()
+
+    # ---------- CUSTOMERS ----------
+
+    def add_customer(self, name: str, phone: str | None = None, credit_limit: float | None = None) -> int | None:
+        """
+        Register a customer. credit_limit caps their outstanding EMI/Credit
+        balance; None means no limit. Returns the customer_id.
+        """
+        name = name.strip()
+        if not name:
+            print("Customer name cannot be empty.")
+            return None
+        phone = phone.strip() if phone and phone.strip() else None
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(
+                    "INSERT INTO customers (name, phone, credit_limit, created_at) VALUES (?, ?, ?, ?)",
+                    (name, phone, credit_limit, now),
+                )
+            except sqlite3.IntegrityError:
+                print(f"A customer with phone {phone} already exists.")
+                return None
+            customer_id = cursor.lastrowid
+            self._log_event(cursor, journal.CREDIT_LIMIT, customer_id, credit_limit or 0, now)
+            conn.commit()
+
+        print(f"Added customer '{name}': id={customer_id}, credit_limit={credit_limit}")
+        self._after_commit()
+        return customer_id
+
+    def set_credit_limit(self, customer_id: int, credit_limit: float | None) -> None:
+        """Change a customer's credit limit (None removes it)."""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            self._begin_write(cursor)
+            cursor.execute("SELECT credit_limit FROM customers WHERE customer_id = ?", (customer_id,))
+            row = cursor.fetchone()
+            if not row:
+                conn.rollback()
+                print(f"Customer id {customer_id} not found.")
+                return
+            cursor.execute(
+                "UPDATE customers SET credit_limit = ? WHERE customer_id = ?",
+                (credit_limit, customer_id),
+            )
+            self._log_event(
+                cursor,
+                journal.CREDIT_LIMIT,
+                customer_id,
+                (credit_limit or 0) - (row[0] or 0),
+                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            )
+            conn.commit()
+
+        print(f"Customer {customer_id} credit limit set to {credit_limit}.")
+        self._after_commit()
+
+    def get_customer(self, customer_id: int) -> dict | None:
+        with self._get_connection() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM customers WHERE customer_id = ?", (customer_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list_customers(self) -> list[dict]:
+        """Every customer, largest outstanding balance first."""
+        with self._get_connection() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(
+                "SELECT * FROM customers ORDER BY outstanding_balance DESC, name"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def find_customers(self, query: str, limit: int = 20) -> list[dict]:
+        """
+        Customers whose name or phone starts with query, by name, at most
+        limit of them. Both halves are index range scans, so the till can
+        search on every keystroke however many customers there are.
+        """
+        query = query.strip()
+        if not query:
+            return []
+        name_pattern = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        phone_pattern = "".join(f"[{c}]" if c in "*?[" else c for c in query) + "*"
+
+        with self._get_connection() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(
+                """
+                SELECT * FROM (
+                    SELECT * FROM customers WHERE name LIKE ? ESCAPE '\\'
+                    ORDER BY name COLLATE NOCASE LIMIT ?
+                )
+                UNION
+                SELECT * FROM (
+                    SELECT * FROM customers WHERE phone GLOB ? ORDER BY phone LIMIT ?
+                )
+                ORDER BY name COLLATE NOCASE, customer_id
+                LIMIT ?
+                """,
+                (name_pattern, limit, phone_pattern, limit, limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def customer_statement(self, customer_id: int, page_size: int = 50, after: tuple | None = None) -> dict:
+        """
+        One page of a customer's sales and payments, newest first.
+
+        Pages are keyed on the last entry shown rather than an OFFSET, so
+        page 100 costs the same as page 1: pass the returned 'next_cursor'
+        back as after= to get the following page ('next_cursor' is None on the
+        last page). Within the same second a payment sorts above its sale.
+        """
+        # Entries sort on (date, rank, id) descending; rank 0 = sale, 1 = payment
+        if after is None:
+            before_date, before_rank, before_id = "9999-12-31", 1, 2**62
+        else:
+            before_date, before_rank, before_id = after
+        # Translate the page key into a (date, id) bound on each table's own index
+        sale_bound = (before_date, before_id if before_rank == 0 else 2**62)
+        payment_bound = (before_date, before_id if before_rank == 1 else 0)
+
+        with self._get_connection() as conn:
+            rows = conn.execute(
+                """
+                SELECT * FROM (
+                    SELECT sale_date AS entry_date, 0 AS rank, sale_id AS entry_id, 'Sale' AS entry_type,
+                           sale_id, quantity || ' x ' || product_name AS description,
+                           payment_type, status, total_amount AS debit, 0.0 AS credit
+                    FROM sales
+                    WHERE customer_id = ? AND (sale_date, sale_id) < (?, ?)
+                    ORDER BY sale_date DESC, sale_id DESC
+                    LIMIT ?
+                )
+                UNION ALL
+                SELECT * FROM (
+                    SELECT payment_date, 1, payment_id, 'Payment',
+                           sale_id, COALESCE(notes, 'Payment'),
+                           NULL, NULL, 0.0, amount_paid
+                    FROM payments
+                    WHERE customer_id = ? AND (payment_date, payment_id) < (?, ?)
+                    ORDER BY payment_date DESC, payment_id DESC
+                    LIMIT ?
+                )
+                ORDER BY entry_date DESC, rank DESC, entry_id DESC
+                LIMIT ?
+                """,
+                (
+                    customer_id, *sale_bound, page_size + 1,
+                    customer_id, *payment_bound, page_size + 1,
+                    page_size + 1,
+                ),
+            ).fetchall()
+
+        columns = (
+            "entry_date", "rank", "entry_id", "entry_type", "sale_id",
+            "description", "payment_type", "status", "debit", "credit",
+        )
+        entries = [dict(zip(columns, row)) for row in rows[:page_size]]
+        next_cursor = None
+        if len(rows) > page_size:
+            last = entries[-1]
+            next_cursor = (last["entry_date"], last["rank"], last["entry_id"])
+
+        return {"customer": self.get_customer(customer_id), "entries": entries, "next_cursor": next_cursor}
+
+    # ---------- TILL SYNC ----------
+
+    def apply_till_batch(self, ops: list[dict]) -> list[dict]:
+        """
+        Apply a batch of sales and payments recorded offline at a till, in
+        one transaction. Every op carries a client-generated op_uuid, so a
+        batch that is pushed again is not applied twice.
+
+        Sale ops: op_uuid, product_name, quantity, unit_price, payment_type,
+        created_at. Payment ops: op_uuid, amount, created_at and either
+        sale_uuid (a till sale) or sale_id (a sale made centrally).
+
+        Conflict rule (see till.py): a till sale is always accepted at the
+        till's price, even if central stock is short, because the goods have
+        already left the shop. Stock is decremented anyway (it may go
+        negative) and the op comes back as 'conflict' for a manager to
+        reconcile. Ops naming an unknown product or sale are 'rejected' and
+        leave the database untouched.
+
+        Sales and payments keep the till's created_at, but are journaled at
+        sync time: Journal.replay relies on event timestamps rising with
+        event_id, and a till can be offline for days.
+
+        Returns one {'op_uuid', 'status', 'sale_id', 'note'} per op, where
+        status is 'synced', 'conflict' or 'rejected'.
+        """
+        results = []
+        synced_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            self._begin_write(cursor)
+
+            for op in ops:
+                op_uuid = op["op_uuid"]
+
+                if op["kind"] == "sale":
+                    cursor.execute("SELECT sale_id FROM sales WHERE client_uuid = ?", (op_uuid,))
+                    row = cursor.fetchone()
+                    if row:
+                        results.append({"op_uuid": op_uuid, "status": "synced", "sale_id": row[0], "note": "already applied"})
+                        continue
+
+                    cursor.execute(
+                        "SELECT product_id, stock FROM products WHERE name = ?",
+                        (op["product_name"],),
+                    )
+                    row = cursor.fetchone()
+                    if not row or op["quantity"] <= 0:
+                        note = "unknown product" if not row else "quantity must be positive"
+                        results.append({"op_uuid": op_uuid, "status": "rejected", "sale_id": None, "note": note})
+                        continue
+
+                    product_id, current_stock = row
+                    sale_id, _, _ = self._insert_sale(
+                        cursor,
+                        product_id,
+                        op["product_name"],
+                        op["quantity"],
+                        op["unit_price"],
+                        self._normalize_payment_type(op["payment_type"]),
+                        op["created_at"],
+                        client_uuid=op_uuid,
+                        logged_at=synced_at,
+                    )
+                    if current_stock < op["quantity"]:
+                        results.append({
+                            "op_uuid": op_uuid,
+                            "status": "conflict",
+                            "sale_id": sale_id,
+                            "note": f"oversold: central stock was {current_stock}, sold {op['quantity']}",
+                        })
+                    else:
+                        results.append({"op_uuid": op_uuid, "status": "synced", "sale_id": sale_id, "note": None})
+
+                else:
+                    cursor.execute("SELECT sale_id FROM payments WHERE client_uuid = ?", (op_uuid,))
+                    row = cursor.fetchone()
+                    if row:
+                        results.append({"op_uuid": op_uuid, "status": "synced", "sale_id": row[0], "note": "already applied"})
+                        continue
+
+                    sale_id = op.get("sale_id")
+                    if op.get("sale_uuid"):
+                        cursor.execute("SELECT sale_id FROM sales WHERE client_uuid = ?", (op["sale_uuid"],))
+                        row = cursor.fetchone()
+                        sale_id = row[0] if row else None
+
+                    if op["amount"] <= 0:
+                        results.append({"op_uuid": op_uuid, "status": "rejected", "sale_id": sale_id, "note": "amount must be positive"})
+                        continue
+
+                    applied = None
+                    if sale_id is not None:
+                        applied = self._insert_payment(
+                            cursor, sale_id, op["amount"], op["created_at"], client_uuid=op_uuid, logged_at=synced_at
+                        )
+                    if applied is None:
+                        results.append({"op_uuid": op_uuid, "status": "rejected", "sale_id": sale_id, "note": "sale not found"})
+                    else:
+                        results.append({"op_uuid": op_uuid, "status": "synced", "sale_id": sale_id, "note": None})
+
+            conn.commit()
+
+        counts = {}
+        for result in results:
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+        print(f"Till batch applied: {counts}")
+
+        self._after_commit()
+        return results
+
+    # ---------- REPORTING ----------
+
+    def refresh_report_snapshot(self) -> None:
+        """
+        Copy the primary database into a fresh snapshot file using the sqlite3
+        backup API, then swap it in for reporting queries. Readers still on
+        the previous snapshot keep it until they finish; the last one out
+        deletes it.
+        """
+        fd, path = tempfile.mkstemp(prefix=f"{Path(self.db_name).stem}-report-", suffix=".db")
+        os.close(fd)
+        source = self._get_connection()
+        snapshot = sqlite3.connect(path)
+        try:
+            source.backup(snapshot)
+        finally:
+            snapshot.close()
+            source.close()
+
+        with self._report_lock:
+            old, self._report_path = self._report_path, path
+            self._report_taken_at = time.time()
+            self._report_files.add(path)
+            retire = old is not None and not self._report_readers.get(old)
+            if retire:
+                self._report_files.discard(old)
+        if retire:
+            _remove_snapshot(old)
+
+    def report_staleness(self) -> float | None:
+        """Age of the reporting snapshot in seconds, or None if reads go to the primary."""
+        if self._report_taken_at is None:
+            return None
+        return time.time() - self._report_taken_at
+
+    @contextmanager
+    def reporting_connection(self):
+        """
+        Connection for dashboards and reports.
+        Uses the snapshot when reporting mode is on, refreshing it first if it
+        is older than report_refresh_interval; otherwise a primary connection.
+        Each caller gets its own read-only connection, so reports run side by
+        side and never hold up a refresh.
+        """
+        if self.report_refresh_interval is None:
+            conn = self._get_connection()
+            try:
+                yield conn
+            finally:
+                conn.close()
+            return
+
+        staleness = self.report_staleness()
+        if staleness is None or staleness >= self.report_refresh_interval:
+            # Only the first caller waits for a snapshot; later callers keep
+            # reading the old one while somebody else refreshes it.
+            if self._report_refresh_lock.acquire(blocking=self._report_path is None):
+                try:
+                    if self._report_path is None or self.report_staleness() >= self.report_refresh_interval:
+                        self.refresh_report_snapshot()
+                finally:
+                    self._report_refresh_lock.release()
+
+        with self._report_lock:
+            path = self._report_path
+            self._report_readers[path] = self._report_readers.get(path, 0) + 1
+        try:
+            # The file never changes once written, so skip SQLite's locking
+            conn = sqlite3.connect(f"{Path(path).as_uri()}?mode=ro&immutable=1", uri=True)
+            try:
+                conn.execute("PRAGMA query_only = ON")
+                yield conn
+            finally:
+                conn.close()
+        finally:
+            with self._report_lock:
+                self._report_readers[path] -= 1
+                retire = not self._report_readers[path] and path != self._report_path
+                if retire:
+                    del self._report_readers[path]
+                    self._report_files.discard(path)
+            if retire:
+                _remove_snapshot(path)
+
+
+def _remove_snapshot(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _remove_snapshots(paths: set) -> None:
+    """Delete whatever snapshot files a StoreManager still owns when it goes away."""
+    for path in list(paths):
+        _remove_snapshot(path)
@@ -0,0 +1,451 @@
+# till.py
+"""
+Offline-capable till mode.
+
+A Till records every sale and payment in a small local SQLite outbox and
+returns straight away; checkout never touches the central database. A
+background thread pushes queued ops to the central StoreManager in batches
+(StoreManager.apply_till_batch). Every op has a client-generated UUID, so
+pushing the same batch twice is harmless.
+
+Stock conflict rule
+-------------------
+The till checks quantity against its own cached stock, refreshed from the
+central database after every successful sync. Central stock may still have
+moved in the meantime. When a synced sale finds central stock short, the sale
+is still accepted at the till's price (the customer has left with the goods),
+central stock is decremented anyway and may go negative, and the outbox row
+is marked 'conflict' with a note so a manager can restock or write it off.
+Ops for an unknown product or sale are marked 'rejected' and are not applied;
+they can be pushed again with `replay` once the product or sale exists.
+
+    python till.py sell --outbox till_1.db --store main
+    python till.py status --outbox till_1.db
+    python till.py replay --outbox till_1.db --store main [--all]
+    python till.py bench
+"""
+import argparse
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import db_setup
+from store_manager import StoreManager
+
+
+def create_outbox(path: str) -> None:
+    """Create the till's local tables if they do not exist."""
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS outbox (
+            seq            INTEGER PRIMARY KEY AUTOINCREMENT,
+            op_uuid        TEXT    NOT NULL UNIQUE,
+            kind           TEXT    NOT NULL,  -- 'sale' or 'payment'
+            product_name   TEXT,              -- sale
+            quantity       INTEGER,           -- sale
+            unit_price     REAL,              -- sale
+            payment_type   TEXT,              -- sale
+            sale_uuid      TEXT,              -- payment for a till sale
+            sale_id        INTEGER,           -- payment for a central sale
+            amount         REAL,              -- payment
+            created_at     TEXT    NOT NULL,
+            sync_status    TEXT    NOT NULL DEFAULT 'queued',  -- 'queued', 'synced', 'conflict', 'rejected'
+            central_sale_id INTEGER,
+            sync_note      TEXT,
+            synced_at      TEXT
+        );
+        """
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox (sync_status, seq)")
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS local_products (
+            name  TEXT    PRIMARY KEY,
+            price REAL    NOT NULL,
+            stock INTEGER NOT NULL
+        );
+        """
+    )
+    conn.commit()
+    conn.close()
+
+
+class Till:
+    """A point-of-sale till that keeps selling while the central database is busy or away."""
+
+    def __init__(self, outbox_path: str, central: StoreManager, sync_interval: float = 5.0, batch_size: int = 200):
+        self.outbox_path = outbox_path
+        self.central = central
+        self.sync_interval = sync_interval
+        self.batch_size = batch_size
+        self.last_sync_error = None
+        self._sync_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        create_outbox(outbox_path)
+
+    # ---------- INTERNAL UTILS ----------
+
+    def _get_connection(self):
+        return sqlite3.connect(self.outbox_path)
+
+    # ---------- CHECKOUT (LOCAL ONLY) ----------
+
+    def process_sale(self, product_name: str, quantity: int, payment_type: str = "Cash") -> str | None:
+        """
+        Record a sale in the outbox at the till's cached price.
+        Returns the sale's UUID, or None if the till cannot sell it.
+        """
+        product_name = product_name.strip()
+        if quantity <= 0:
+            print("Quantity must be positive.")
+            return None
+
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT price, stock FROM local_products WHERE name = ?", (product_name,))
+            row = cursor.fetchone()
+            if not row:
+                print(f"Product '{product_name}' not found at this till.")
+                return None
+
+            price, local_stock = row
+            if local_stock < quantity:
+                print(
+                    f"Not enough stock for '{product_name}'. "
+                    f"Requested={quantity}, Available={local_stock}"
+                )
+                return None
+
+            sale_uuid = str(uuid.uuid4())
+            cursor.execute(
+                """
+                INSERT INTO outbox (op_uuid, kind, product_name, quantity, unit_price, payment_type, created_at)
+                VALUES (?, 'sale', ?, ?, ?, ?, ?)
+                """,
+                (
+                    sale_uuid,
+                    product_name,
+                    quantity,
+                    price,
+                    payment_type,
+                    datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                ),
+            )
+            cursor.execute(
+                "UPDATE local_products SET stock = stock - ? WHERE name = ?",
+                (quantity, product_name),
+            )
+            conn.commit()
+
+        print(f"Sale queued at till: {sale_uuid}, {quantity}x '{product_name}', type={payment_type}")
+        return sale_uuid
+
+    def record_payment(self, sale: str | int, amount_paid: float) -> str | None:
+        """
+        Queue a payment. sale is a till sale UUID or a central sale_id.
+        Returns the payment's UUID.
+        """
+        if amount_paid <= 0:
+            print("Payment amount must be positive.")
+            return None
+
+        payment_uuid = str(uuid.uuid4())
+        sale_uuid, sale_id = (sale, None) if isinstance(sale, str) else (None, sale)
+        with self._get_connection() as conn:
+            conn.execute(
+                """
+                INSERT INTO outbox (op_uuid, kind, sale_uuid, sale_id, amount, created_at)
+                VALUES (?, 'payment', ?, ?, ?, ?)
+                """,
+                (payment_uuid, sale_uuid, sale_id, amount_paid, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+            )
+            conn.commit()
+
+        print(f"Payment queued at till: {payment_uuid}, +{amount_paid} for sale {sale}")
+        return payment_uuid
+
+    # ---------- SYNC ----------
+
+    def refresh_products(self) -> None:
+        """
+        Replace the till's price list and stock view with the central one,
+        less whatever this till has sold but not yet synced.
+        """
+        central = sqlite3.connect(self.central.db_name)
+        try:
+            products = central.execute("SELECT name, price, stock FROM products").fetchall()
+        finally:
+            central.close()
+
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("DELETE FROM local_products")
+            cursor.executemany("INSERT INTO local_products (name, price, stock) VALUES (?, ?, ?)", products)
+            cursor.execute(
+                """
+                UPDATE local_products SET stock = stock - (
+                    SELECT COALESCE(SUM(quantity), 0) FROM outbox
+                    WHERE kind = 'sale' AND sync_status = 'queued' AND product_name = local_products.name
+                )
+                """
+            )
+            conn.commit()
+
+    def _push(self, rows: list[tuple]) -> dict:
+        """Push outbox rows to the central database and record the outcome."""
+        columns = (
+            "seq", "op_uuid", "kind", "product_name", "quantity", "unit_price",
+            "payment_type", "sale_uuid", "sale_id", "amount", "created_at",
+        )
+        ops = [dict(zip(columns, row)) for row in rows]
+        results = self.central.apply_till_batch(ops)
+
+        synced_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._get_connection() as conn:
+            conn.executemany(
+                """
+                UPDATE outbox SET sync_status = ?, central_sale_id = ?, sync_note = ?, synced_at = ?
+                WHERE op_uuid = ?
+                  -- A re-pushed op comes back 'already applied'; keep its original outcome
+                  AND NOT (? = 'already applied' AND sync_status IN ('synced', 'conflict'))
+                """,
+                (
+                    (result["status"], result["sale_id"], result["note"], synced_at, result["op_uuid"], result["note"])
+                    for result in results
+                ),
+            )
+            conn.commit()
+
+        counts = {}
+        for result in results:
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+        return counts
+
+    def _select_ops(self, statuses: tuple[str, ...], after_seq: int) -> list[tuple]:
+        with self._get_connection() as conn:
+            return conn.execute(
+                f"""
+                SELECT seq, op_uuid, kind, product_name, quantity, unit_price,
+                       payment_type, sale_uuid, sale_id, amount, created_at
+                FROM outbox
+                WHERE sync_status IN ({", ".join("?" for _ in statuses)}) AND seq > ?
+                ORDER BY seq
+                LIMIT ?
+                """,
+                (*statuses, after_seq, self.batch_size),
+            ).fetchall()
+
+    def sync_once(self) -> dict:
+        """
+        Push every queued op, a batch at a time, oldest first.
+        Returns counts per sync status. Raises sqlite3.OperationalError if
+        the central database stays locked; queued ops are kept for next time.
+        """
+        totals = {}
+        with self._sync_lock:
+            after_seq = 0
+            while True:
+                rows = self._select_ops(("queued",), after_seq)
+                if not rows:
+                    break
+                for status, count in self._push(rows).items():
+                    totals[status] = totals.get(status, 0) + count
+                after_seq = rows[-1][0]
+            self.refresh_products()
+        return totals
+
+    def replay(self, include_synced: bool = False) -> dict:
+        """
+        Push the outbox again: queued and rejected ops, or with include_synced
+        every op. Already-applied ops are recognised by UUID and skipped.
+        """
+        statuses = ("queued", "rejected", "conflict", "synced") if include_synced else ("queued", "rejected")
+        totals = {}
+        with self._sync_lock:
+            after_seq = 0
+            while True:
+                rows = self._select_ops(statuses, after_seq)
+                if not rows:
+                    break
+                for status, count in self._push(rows).items():
+                    totals[status] = totals.get(status, 0) + count
+                after_seq = rows[-1][0]
+            self.refresh_products()
+        return totals
+
+    def _sync_loop(self) -> None:
+        while not self._stop.wait(self.sync_interval):
+            try:
+                self.sync_once()
+                self.last_sync_error = None
+            except sqlite3.Error as e:
+                # Central database locked or unreachable: keep selling, retry later
+                self.last_sync_error = str(e)
+
+    def start(self) -> None:
+        """Start the background sync thread."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sync_loop, name="till-sync", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background sync thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def status(self) -> dict:
+        """Number of outbox ops per sync status."""
+        with self._get_connection() as conn:
+            return dict(conn.execute("SELECT sync_status, COUNT(*) FROM outbox GROUP BY sync_status"))
+
+
+# ---------- BENCHMARK ----------
+
+def benchmark(sales: int = 300, lock_seconds: float = 0.5) -> dict:
+    """
+    Checkout latency at a till vs. direct StoreManager.process_sale while a
+    stand-in central database is repeatedly held under an exclusive lock.
+    """
+    import contextlib
+    import io
+    import os
+    import shutil
+    import statistics
+    import tempfile
+
+    import db_setup
+
+    tmp_dir = tempfile.mkdtemp(prefix="till_bench_")
+    central_db = os.path.join(tmp_dir, "central.db")
+    db_setup.create_tables(central_db)
+    central = StoreManager(central_db)
+    stop = threading.Event()
+
+    def hog_central():
+        # Another writer holding the central file for lock_seconds at a time
+        conn = sqlite3.connect(central_db, isolation_level=None)
+        while not stop.is_set():
+            conn.execute("BEGIN EXCLUSIVE")
+            time.sleep(lock_seconds)
+            conn.execute("COMMIT")
+            time.sleep(0.05)
+        conn.close()
+
+    def timed(fn, n):
+        latencies = []
+        for i in range(n):
+            start = time.perf_counter()
+            try:
+                fn(i)
+            except sqlite3.OperationalError:
+                pass
+            latencies.append((time.perf_counter() - start) * 1e3)
+        latencies.sort()
+        return {
+            "p50_ms": statistics.median(latencies),
+            "p99_ms": latencies[int(len(latencies) * 0.99) - 1],
+            "max_ms": latencies[-1],
+        }
+
+    report = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        central.add_product("Tea", 3.0, sales * 10)
+        till = Till(os.path.join(tmp_dir, "till.db"), central, sync_interval=0.2)
+        till.refresh_products()
+
+        report["till_idle_central"] = timed(lambda i: till.process_sale("Tea", 1), sales // 3)
+
+        hog = threading.Thread(target=hog_central, daemon=True)
+        hog.start()
+        till.start()
+        report["till_busy_central"] = timed(lambda i: till.process_sale("Tea", 1), sales // 3)
+        report["direct_busy_central"] = timed(lambda i: central.process_sale("Tea", 1), min(20, sales // 3))
+        stop.set()
+        hog.join()
+        till.stop()
+
+        till.sync_once()
+        before = sqlite3.connect(central_db).execute("SELECT COUNT(*) FROM sales").fetchone()[0]
+        till.replay(include_synced=True)
+        after = sqlite3.connect(central_db).execute("SELECT COUNT(*) FROM sales").fetchone()[0]
+
+    report["outbox"] = till.status()
+    report["replay_added_sales"] = after - before
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    return report
+
+
+# ---------- CLI ----------
+
+def sell_loop(till: Till) -> None:
+    """
+    Interactive checkout at the till. Sales are queued in the outbox and
+    synced in the background; an empty product name ends the shift with a
+    final sync.
+    """
+    till.refresh_products()
+    till.start()
+    payment_types = {"1": "Cash", "2": "EMI", "3": "Credit"}
+    try:
+        while True:
+            product_name = input("Product (empty to finish): ").strip()
+            if not product_name:
+                break
+            try:
+                quantity = int(input("Quantity: "))
+            except ValueError:
+                print("Quantity must be a number.")
+                continue
+            choice = input("Payment 1. Cash  2. EMI  3. Credit (default 1): ").strip()
+            till.process_sale(product_name, quantity, payment_types.get(choice, "Cash"))
+    except (EOFError, KeyboardInterrupt):
+        print()
+    finally:
+        till.stop()
+
+    try:
+        print(f"Synced: {till.sync_once()}")
+    except sqlite3.Error as e:
+        print(f"Central database unavailable ({e}); queued sales will sync next time.")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline till outbox tools.")
+    parser.add_argument("command", choices=["sell", "status", "replay", "sync", "bench"])
+    parser.add_argument("--outbox", default="till.db", help="till outbox database")
+    parser.add_argument("--store", default=db_setup.DEFAULT_STORE, help="central store id")
+    parser.add_argument("--all", action="store_true", help="replay: also re-push ops already synced")
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        for name, value in benchmark().items():
+            print(f"{name:>22}: {value}")
+        return 0
+
+    path = db_setup.store_db_path(args.store)
+    if not db_setup.is_store_db(path):
+        parser.error(f"store {args.store!r} has no database at {path}")
+    till = Till(args.outbox, StoreManager.for_store(args.store))
+    if args.command == "sell":
+        sell_loop(till)
+    elif args.command == "replay":
+        print(f"Replayed: {till.replay(include_synced=args.all)}")
+    elif args.command == "sync":
+        print(f"Synced: {till.sync_once()}")
+    print(f"Outbox: {till.status()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())